@@ -1,22 +1,19 @@
 import json
-import openai
-from config import OPENAI_API_KEY, DEBUG_MODE
+from clients import create_chat_completion
+from deadline import DeadlineExceeded, deadline_expired
+from config import DEBUG_MODE, ANALYSIS_MODELS, CASCADE_MIN_NAME_COVERAGE
+from model_cascade import run_cascade
+from helper import health_score, check_allergens
 from typing import List, cast
 from openai.types.chat import ChatCompletionUserMessageParam
 
-openai.api_key = OPENAI_API_KEY
 
-
-def analyze_menu_with_preferences(dishes_with_nutrition, user_preferences):
+def build_analysis_messages(dishes_with_nutrition, user_preferences):
     """
-    Use LLM agent to analyze menu and provide personalized recommendations
-
-    Args:
-        dishes_with_nutrition: List of dishes with nutrition data
-        user_preferences: Dict with goal, diet_type, allergies, calorie_target
+    Build the chat messages for the nutritionist agent
 
-    Returns:
-        dict: Analysis results with rankings, recommendations, and combos
+    The JSON schema lists top_picks first so a streamed response delivers
+    the most useful section earliest.
     """
 
     # Build menu context for LLM
@@ -58,14 +55,6 @@ SCORING CRITERIA:
 
 Return response as VALID JSON ONLY (no markdown, no preamble):
 {{
-    "ranked_dishes": [
-        {{
-            "name": "dish name",
-            "rank": 1,
-            "score": 95,
-            "reason": "High protein (35g), moderate calories (450), fits low-carb preference"
-        }}
-    ],
     "top_picks": [
         {{
             "name": "dish name",
@@ -74,12 +63,6 @@ Return response as VALID JSON ONLY (no markdown, no preamble):
             "eating_tips": "Ask for extra vegetables instead of rice to lower carbs"
         }}
     ],
-    "avoid": [
-        {{
-            "name": "dish name",
-            "reason": "Contains dairy (user allergy) and excessive sugar (45g)"
-        }}
-    ],
     "meal_combos": [
         {{
             "items": ["Greek Salad", "Grilled Chicken Breast"],
@@ -91,6 +74,20 @@ Return response as VALID JSON ONLY (no markdown, no preamble):
             "cost_estimate": "$28"
         }}
     ],
+    "ranked_dishes": [
+        {{
+            "name": "dish name",
+            "rank": 1,
+            "score": 95,
+            "reason": "High protein (35g), moderate calories (450), fits low-carb preference"
+        }}
+    ],
+    "avoid": [
+        {{
+            "name": "dish name",
+            "reason": "Contains dairy (user allergy) and excessive sugar (45g)"
+        }}
+    ],
     "allergen_warnings": [
         "Pasta Alfredo contains dairy",
         "Pecan Pie contains nuts"
@@ -98,38 +95,80 @@ Return response as VALID JSON ONLY (no markdown, no preamble):
     "general_advice": "Focus on grilled proteins and avoid fried options. Ask for dressings on the side."
 }}"""
 
+    messages: List[ChatCompletionUserMessageParam] = cast(List[ChatCompletionUserMessageParam], cast(object, [
+        {
+            "role": "system",
+            "content": "You are a certified nutritionist providing personalized dietary advice. Always prioritize user health and safety."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]))
+    return messages
+
+
+def analyze_menu_with_preferences(dishes_with_nutrition, user_preferences, on_item=None):
+    """
+    Use LLM agent to analyze menu and provide personalized recommendations
+
+    Args:
+        dishes_with_nutrition: List of dishes with nutrition data
+        user_preferences: Dict with goal, diet_type, allergies, calorie_target
+        on_item: Optional callback; when given, the first tier is streamed and
+            on_item(section, item) is called for every completed entry
+
+    Returns:
+        dict: Analysis results with rankings, recommendations, and combos
+
+    Runs the ANALYSIS_MODELS cascade, escalating when check_analysis_confidence
+    rejects a cheaper model's answer. Escalated tiers are not streamed; before
+    one runs, on_item("reset", None) tells the caller to drop the preview of
+    the rejected answer, which the final analysis then replaces.
+    """
+    messages = build_analysis_messages(dishes_with_nutrition, user_preferences)
+
     content: str = ""
     try:
-        messages: List[ChatCompletionUserMessageParam] = cast(List[ChatCompletionUserMessageParam], cast(object, [
-            {
-                "role": "system",
-                "content": "You are a certified nutritionist providing personalized dietary advice. Always prioritize user health and safety."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]))
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=2500
-        )
 
-        content = response.choices[0].message.content.strip()
+        def call_model(model):
+            nonlocal content
+            if on_item and model == ANALYSIS_MODELS[0]:
+                content = _stream_completion(model, messages, on_item)
+            else:
+                if on_item:
+                    on_item("reset", None)
+                response = create_chat_completion(
+                    model=model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=2500
+                )
+                content = response.choices[0].message.content.strip()
 
-        if DEBUG_MODE:
-            print(f"Raw Agent Response:\\n{content}")
+            if DEBUG_MODE:
+                print(f"Raw Agent Response ({model}):\\n{content}")
 
-        # Clean markdown if present
-        if content.startswith('```'):
-            content = content.split('```')[1]
-            if content.startswith('json'):
-                content = content[4:]
+            # Clean markdown if present
+            content = content.strip()
+            if content.startswith('```'):
+                content = content.split('```')[1]
+                if content.startswith('json'):
+                    content = content[4:]
 
-        analysis = json.loads(content.strip())
+            return json.loads(content.strip())
+
+        analysis, _, low_confidence = run_cascade(
+            "analysis",
+            ANALYSIS_MODELS,
+            call_model,
+            lambda result: check_analysis_confidence(result, dishes_with_nutrition),
+            # e.g. a ranking that misses some dishes beats the rule-based fallback
+            usable=lambda result: check_analysis_structure(result) is None
+        )
 
+        if low_confidence:
+            analysis["low_confidence"] = low_confidence
         return analysis
 
     except json.JSONDecodeError as e:
@@ -141,6 +180,159 @@ Return response as VALID JSON ONLY (no markdown, no preamble):
         return get_fallback_analysis(dishes_with_nutrition, user_preferences)
 
 
+def _stream_completion(model, messages, on_item):
+    """Stream one analysis completion, reporting entries as they complete; returns the raw text"""
+    parser = StreamingAnalysisParser()
+    content = ""
+
+    stream = create_chat_completion(
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=2500,
+        stream=True
+    )
+
+    for chunk in stream:
+        # The request timeout only bounds the gap between chunks
+        if deadline_expired():
+            stream.close()
+            raise DeadlineExceeded("Analysis stream ran past the request deadline")
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        delta = chunk.choices[0].delta.content
+        content += delta
+        for section, item in parser.feed(delta):
+            on_item(section, item)
+
+    return content
+
+
+class StreamingAnalysisParser:
+    """
+    Incremental parser for the analysis JSON object
+
+    Feed it raw text chunks as they arrive; it returns (section, item) events
+    for every array entry of a top-level key (e.g. one top pick) and for
+    top-level string values (general_advice) as soon as they are complete.
+    Text outside the outer object, such as markdown fences, is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.expect_key = False
+        self.key = None
+        self.in_array = False
+        self.item_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        events = []
+
+        while self.pos < len(self.buffer):
+            i = self.pos
+            ch = self.buffer[i]
+            self.pos += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    raw = self.buffer[self.string_start:i + 1]
+                    if self.depth == 1 and self.expect_key:
+                        self.key = json.loads(raw)
+                        self.expect_key = False
+                    elif self.depth == 1:
+                        events.append((self.key, json.loads(raw)))
+                    elif self.depth == 2 and self.item_start == self.string_start:
+                        events.append((self.key, json.loads(raw)))
+                        self.item_start = None
+                continue
+
+            if self.depth == 0 and ch != '{':
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+                if self.depth == 2 and self.in_array and self.item_start is None:
+                    self.item_start = i
+            elif ch in '{[':
+                if self.depth == 1:
+                    self.in_array = ch == '['
+                elif self.depth == 2 and self.in_array and self.item_start is None:
+                    self.item_start = i
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = True
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 2 and self.item_start is not None:
+                    events.append((self.key, json.loads(self.buffer[self.item_start:i + 1])))
+                    self.item_start = None
+            elif ch == ',' and self.depth == 1:
+                self.expect_key = True
+
+        return events
+
+
+def check_analysis_structure(analysis):
+    """
+    Returns:
+        None if the analysis has the sections the UI renders, otherwise what is wrong
+    """
+    if not isinstance(analysis, dict):
+        return "response is not a JSON object"
+
+    for key in ("ranked_dishes", "top_picks"):
+        if not isinstance(analysis.get(key), list) or not analysis[key]:
+            return f"missing {key}"
+
+    for pick in analysis['top_picks']:
+        if not isinstance(pick, dict) or not all(k in pick for k in ("name", "why_good", "nutrition_highlights")):
+            return "malformed top_picks entry"
+
+    for combo in analysis.get('meal_combos', []):
+        if not isinstance(combo, dict) or not isinstance(combo.get('items'), list):
+            return "malformed meal_combos entry"
+
+    return None
+
+
+def check_analysis_confidence(analysis, dishes_with_nutrition):
+    """
+    Decide whether an analysis is good enough to keep
+
+    Requires the expected sections and that the ranking covers most of the
+    dishes we sent (by name), so a cheap model can't silently drop items.
+
+    Returns:
+        None if acceptable, otherwise the reason to escalate
+    """
+    reason = check_analysis_structure(analysis)
+    if reason is not None:
+        return reason
+
+    expected = {d.get('dish', d.get('name', '')).strip().lower() for d in dishes_with_nutrition}
+    ranked = {
+        str(r.get('name', '')).strip().lower()
+        for r in analysis['ranked_dishes'] if isinstance(r, dict)
+    }
+    coverage = len(expected & ranked) / len(expected) if expected else 1.0
+    if coverage < CASCADE_MIN_NAME_COVERAGE:
+        return f"ranking covers only {coverage:.0%} of dishes"
+
+    return None
+
+
 def get_fallback_analysis(dishes, user_prefs):
     """Simple rule-based analysis if LLM fails"""
 
@@ -171,5 +363,69 @@ def get_fallback_analysis(dishes, user_prefs):
         "avoid": [],
         "meal_combos": [],
         "allergen_warnings": [],
-        "general_advice": "Analysis based on basic nutrition data. For detailed recommendations, ensure API connection."
-    }
\ No newline at end of file
+        "general_advice": "Analysis based on basic nutrition data. For detailed recommendations, ensure API connection.",
+        "source": "fallback"
+    }
+
+
+def rescore_dishes_locally(dishes_with_nutrition, user_preferences):
+    """
+    Fast rule-based re-ranking for a changed user profile
+
+    Used when only the sidebar preferences change: no API calls, so the
+    results update in milliseconds. Diet type is not checked here, the
+    LLM analysis remains the authoritative one.
+    """
+    goal = user_preferences['goal']
+    calorie_target = user_preferences['calorie_target']
+    allergies = user_preferences.get('allergies', [])
+
+    scored = []
+    for d in dishes_with_nutrition:
+        name = d.get('name', d.get('dish'))
+        detected = check_allergens(name, d.get('description', ''), allergies)
+
+        score = health_score(d, goal)
+        # Calorie fit: lose a point per 20 calories away from the target (max 25)
+        score -= min(25, abs(d.get('calories', 0) - calorie_target) // 20)
+        if detected:
+            score = 0
+
+        scored.append((max(0, min(100, score)), name, d, detected))
+
+    scored.sort(key=lambda s: s[0], reverse=True)
+
+    return {
+        "ranked_dishes": [
+            {
+                "name": name,
+                "rank": i + 1,
+                "score": score,
+                "reason": f"{d['calories']} calories, {d['protein']}g protein"
+            }
+            for i, (score, name, d, _) in enumerate(scored)
+        ],
+        "top_picks": [
+            {
+                "name": name,
+                "why_good": f"Scores {score}/100 for your goal and calorie target",
+                "nutrition_highlights": f"{d['calories']} cal, {d['protein']}g protein, "
+                                        f"{d['carbs']}g carbs, {d['fat']}g fat"
+            }
+            for score, name, d, detected in scored if not detected
+        ][:3],
+        "avoid": [
+            {
+                "name": name,
+                "reason": f"Contains {', '.join(detected)}"
+            }
+            for _, name, _, detected in scored if detected
+        ],
+        "meal_combos": [],
+        "allergen_warnings": [
+            f"{name} contains {', '.join(detected)}"
+            for _, name, _, detected in scored if detected
+        ],
+        "general_advice": "Quick re-score based on nutrition data only. "
+                          "Refresh the AI recommendations for meal combos and dietary preference checks."
+    }
@@ -3,10 +3,14 @@ import json
 from PIL import Image
 
 # Import our custom modules
-from menu_extractor import extract_menu_from_image, validate_extracted_dishes
-from nutrition_fetch import get_nutrition_with_fallback
-from agent_analyzer import analyze_menu_with_preferences
-from config import DEBUG_MODE
+from pipeline import image_digest
+from jobs import get_job_queue
+from nutrition_fetch import get_usda_metrics
+from agent_analyzer import rescore_dishes_locally
+from model_cascade import get_cascade_metrics
+from clients import get_openai_scheduler
+from profiling import profile_run
+from config import DEBUG_MODE, PROFILE_MODE
 
 # ============================================================================
 # PAGE CONFIGURATION
@@ -62,6 +66,111 @@ if 'dishes_with_nutrition' not in st.session_state:
     st.session_state.dishes_with_nutrition = None
 if 'analysis' not in st.session_state:
     st.session_state.analysis = None
+if 'analysis_prefs' not in st.session_state:
+    st.session_state.analysis_prefs = None
+if 'analysis_source' not in st.session_state:
+    st.session_state.analysis_source = None
+if 'ai_analyses' not in st.session_state:
+    st.session_state.ai_analyses = {}
+if 'image_digest' not in st.session_state:
+    st.session_state.image_digest = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'job_prefs' not in st.session_state:
+    st.session_state.job_prefs = None
+if 'job_error' not in st.session_state:
+    st.session_state.job_error = None
+if 'menu_update' not in st.session_state:
+    st.session_state.menu_update = None
+if 'skipped_dishes' not in st.session_state:
+    st.session_state.skipped_dishes = []
+
+# ============================================================================
+# BACKGROUND ANALYSIS JOBS
+# ============================================================================
+# The pipeline runs on the job queue's workers; this script only submits a
+# job and polls it, so reruns and widget changes never cancel API work.
+
+JOB_STAGES = [
+    ("extracting", "Extracting dishes from menu"),
+    ("nutrition", "Fetching nutrition data"),
+    ("analysis", "Generating personalized recommendations"),
+]
+
+
+def submit_job(user_prefs, prefs_key, **inputs):
+    """Queue an analysis and remember it in this session"""
+    st.session_state.job_id = get_job_queue().submit(user_prefs, **inputs)
+    st.session_state.job_prefs = prefs_key
+    st.session_state.job_error = None
+
+
+def store_job_analysis(analysis, prefs_key):
+    """
+    Make a job's analysis the current one; remember it for this profile if the LLM made it
+
+    A rule-based fallback is shown like a local re-score: not reused when
+    switching back to this profile, and the AI refresh stays available.
+    """
+    st.session_state.analysis = analysis
+    st.session_state.analysis_prefs = prefs_key
+    if analysis.get("source") == "fallback":
+        st.session_state.analysis_source = "fallback"
+        return
+    st.session_state.ai_analyses[prefs_key] = analysis
+    st.session_state.analysis_source = "ai"
+
+
+@st.fragment(run_every=1.0)
+def show_job_progress():
+    """Poll the current job: per-stage progress, streamed picks, then results"""
+    job = get_job_queue().get(st.session_state.job_id)
+
+    if job is None:
+        st.session_state.job_id = None
+        st.rerun()
+
+    if job["status"] == "done":
+        result = job["result"]
+        if result["dishes"] is not None:
+            st.session_state.dishes = result["dishes"]
+        st.session_state.dishes_with_nutrition = result["dishes_with_nutrition"]
+        if result.get("skipped") is not None:  # re-analyses of known dishes keep the notice
+            st.session_state.skipped_dishes = result["skipped"]
+        if result.get("menu_update"):
+            st.session_state.menu_update = result["menu_update"]
+        store_job_analysis(result["analysis"], st.session_state.job_prefs)
+        st.session_state.job_id = None
+        st.rerun()
+
+    if job["status"] == "failed":
+        st.session_state.job_error = (job["stage"], job["error"])
+        st.session_state.job_id = None
+        st.rerun()
+
+    stage_names = [name for name, _ in JOB_STAGES]
+    current = stage_names.index(job["stage"]) if job["stage"] in stage_names else -1
+
+    for i, (name, label) in enumerate(JOB_STAGES):
+        if i < current:
+            st.write(f"✅ {label}")
+        elif i == current:
+            st.write(f"⏳ **{label}...**")
+            if job["message"]:
+                st.caption(job["message"])
+            st.progress(job["progress"])
+    if current < 0:
+        st.write("⏳ Waiting for a free worker...")
+
+    # Recommendations streamed so far; the full results replace them when done
+    partial = job["partial"] or {}
+    for i, pick in enumerate(partial.get("top_picks", []), 1):
+        st.success(f"⭐ **#{i} {pick.get('name')}**: {pick.get('why_good', '')}")
+    for combo in partial.get("meal_combos", []):
+        st.info(f"🍽️ **{' + '.join(combo.get('items', []))}**: "
+                f"{combo.get('total_calories')} cal, {combo.get('total_protein')}g protein")
+    for item in partial.get("ranked_dishes", []):
+        st.caption(f"#{item.get('rank')} {item.get('name')} ({item.get('score')}/100)")
 
 # ============================================================================
 # HEADER
@@ -114,8 +223,46 @@ with st.sidebar:
         st.session_state.dishes = None
         st.session_state.dishes_with_nutrition = None
         st.session_state.analysis = None
+        st.session_state.analysis_prefs = None
+        st.session_state.analysis_source = None
+        st.session_state.ai_analyses = {}
+        st.session_state.image_digest = None
+        st.session_state.job_id = None
+        st.session_state.job_prefs = None
+        st.session_state.job_error = None
+        st.session_state.menu_update = None
+        st.session_state.skipped_dishes = []
         st.rerun()
 
+    profile_runs = PROFILE_MODE
+    profile_render = False
+    if DEBUG_MODE:
+        profile_runs = st.checkbox(
+            "🔬 Profile runs",
+            value=PROFILE_MODE,
+            help="Write a flamegraph (collapsed stacks) and allocation report per analysis"
+        )
+        profile_render = st.button(
+            "🔬 Profile results rendering",
+            help="Rerun the page once with the results rendering profiled"
+        )
+        with st.expander("📊 Model cascade metrics"):
+            st.json(get_cascade_metrics())
+        with st.expander("🚦 OpenAI scheduler metrics"):
+            st.json(get_openai_scheduler().metrics())
+        with st.expander("🛡️ USDA client metrics"):
+            st.json(get_usda_metrics())
+        with st.expander("🧵 Background jobs"):
+            st.json(get_job_queue().metrics())
+
+user_prefs = {
+    "goal": goal.lower().replace(" ", "_"),
+    "diet_type": diet_type.lower(),
+    "allergies": [a.lower() for a in allergies],
+    "calorie_target": calorie_target
+}
+prefs_key = json.dumps(user_prefs, sort_keys=True)
+
 # ============================================================================
 # MAIN CONTENT - UPLOAD & DISPLAY
 # ============================================================================
@@ -129,6 +276,10 @@ with col1:
         type=['jpg', 'jpeg', 'png'],
         help="Take a clear, well-lit photo of the restaurant menu"
     )
+    restaurant = st.text_input(
+        "🏪 Restaurant name (optional)",
+        help="Saves this menu; next time only new or changed dishes are looked up"
+    ).strip()
 
     if uploaded_file:
         # Display uploaded image
@@ -141,109 +292,81 @@ with col2:
 
         # Analyze button
         if st.button(" Analyze Menu", type="primary", use_container_width=True):
+            image_bytes = uploaded_file.getvalue()
+            digest = image_digest(image_bytes)
+            if digest != st.session_state.image_digest:
+                st.session_state.ai_analyses = {}
+            st.session_state.image_digest = digest
+            st.session_state.menu_update = None
+            submit_job(user_prefs, prefs_key, image_bytes=image_bytes, restaurant=restaurant or None,
+                       profile=profile_runs)
+
+    if st.session_state.job_id:
+        show_job_progress()
+
+    update = st.session_state.menu_update
+    if update and not st.session_state.job_id:
+        if update.get("unchanged_image"):
+            st.info(f"🏪 Same menu as saved version {update['version']}, reused its nutrition data")
+        else:
+            st.info(
+                f"🏪 Menu version {update['version']}: {update['added']} added, {update['changed']} changed, "
+                f"{update['removed']} removed, {update['unchanged']} unchanged "
+                f"({update['fetched']} nutrition lookups)"
+            )
+
+    if st.session_state.job_error:
+        stage, error = st.session_state.job_error
+        if stage == "extracting":
+            st.error("❌ Could not extract dishes. Try a clearer photo.")
+        elif stage == "nutrition":
+            st.warning(f"⚠️ {error}")
+        else:
+            st.error(f"❌ Error during {stage}: {error}")
 
-            # ================================================================
-            # STEP 1: EXTRACT DISHES FROM IMAGE
-            # ================================================================
-            with st.status(" Extracting dishes from menu...", expanded=True) as status:
-                st.write(" Using GPT-4 Vision to read menu...")
-
-                try:
-                    uploaded_file.seek(0)  # Reset file pointer
-                    dishes = extract_menu_from_image(uploaded_file)
-                    dishes = validate_extracted_dishes(dishes)
-
-                    if dishes:
-                        st.session_state.dishes = dishes
-                        st.write(f"✅ Found **{len(dishes)}** dishes!")
-                        status.update(label="✅ Extraction complete!", state="complete")
-                    else:
-                        st.error("❌ Could not extract dishes. Try a clearer photo.")
-                        status.update(label="❌ Extraction failed", state="error")
-                        st.stop()
-
-                except Exception as e:
-                    st.error(f"❌ Error during extraction: {str(e)}")
-                    status.update(label="❌ Extraction failed", state="error")
-                    st.stop()
-
-            # ================================================================
-            # STEP 2: FETCH NUTRITION DATA
-            # ================================================================
-            if st.session_state.dishes:
-                with st.status(" Fetching nutrition data...", expanded=True) as status:
-                    st.write(" Querying nutrition databases...")
-
-                    try:
-                        progress_bar = st.progress(0)
-                        dishes_with_nutrition = []
-
-                        for i, dish in enumerate(st.session_state.dishes):
-                            nutrition = get_nutrition_with_fallback(
-                                dish['name'],
-                                dish.get('description', '')
-                            )
-
-                            if nutrition:
-                                dishes_with_nutrition.append(nutrition)
-
-                            # Update progress
-                            progress_bar.progress((i + 1) / len(st.session_state.dishes))
-
-                        st.session_state.dishes_with_nutrition = dishes_with_nutrition
-
-                        if dishes_with_nutrition:
-                            st.write(f"✅ Retrieved nutrition for **{len(dishes_with_nutrition)}** dishes!")
-                            status.update(label="✅ Nutrition data fetched!", state="complete")
-                        else:
-                            st.warning("⚠️ Could not find nutrition data for any dishes.")
-                            status.update(label="⚠️ No nutrition data found", state="error")
-                            st.stop()
-
-                    except Exception as e:
-                        st.error(f"❌ Error fetching nutrition: {str(e)}")
-                        status.update(label="❌ Nutrition fetch failed", state="error")
-                        st.stop()
-
-            # ================================================================
-            # STEP 3: AI AGENT ANALYSIS
-            # ================================================================
-            if st.session_state.get('dishes_with_nutrition'):
-                with st.status("🧠 Generating personalized recommendations...", expanded=True) as status:
-                    st.write(" AI agent analyzing menu for your profile...")
-
-                    try:
-                        user_prefs = {
-                            "goal": goal.lower().replace(" ", "_"),
-                            "diet_type": diet_type.lower(),
-                            "allergies": [a.lower() for a in allergies],
-                            "calorie_target": calorie_target
-                        }
-
-                        analysis = analyze_menu_with_preferences(
-                            st.session_state.dishes_with_nutrition,
-                            user_prefs
-                        )
-
-                        st.session_state.analysis = analysis
-                        st.write("✅ Analysis complete!")
-                        status.update(label="✅ Recommendations ready!", state="complete")
-
-                    except Exception as e:
-                        st.error(f"❌ Error during analysis: {str(e)}")
-                        status.update(label="❌ Analysis failed", state="error")
-                        st.stop()
+# ============================================================================
+# PREFERENCE CHANGES - RE-RUN ONLY THE ANALYSIS STAGE
+# ============================================================================
+
+if st.session_state.get('dishes_with_nutrition') and st.session_state.analysis_prefs != prefs_key:
+    if prefs_key in st.session_state.ai_analyses:
+        st.session_state.analysis = st.session_state.ai_analyses[prefs_key]
+        st.session_state.analysis_source = "ai"
+    else:
+        st.session_state.analysis = rescore_dishes_locally(
+            st.session_state.dishes_with_nutrition,
+            user_prefs
+        )
+        st.session_state.analysis_source = "local"
+    st.session_state.analysis_prefs = prefs_key
 
 # ============================================================================
 # RESULTS DISPLAY
 # ============================================================================
 
-if st.session_state.get('analysis'):
-    analysis = st.session_state.analysis
-
+def render_analysis(analysis):
+    """Results for the current analysis"""
     st.divider()
     st.header(" Your Personalized Analysis")
 
+    if analysis.get('low_confidence'):
+        st.warning("⚠️ These recommendations may not cover every dish on the menu.")
+
+    skipped = st.session_state.skipped_dishes
+    if skipped:
+        st.warning(f"⏱ Ran out of time looking up nutrition for {len(skipped)} dishes, so they are not "
+                   f"included: {', '.join(skipped)}. Analyze the menu again to include them.")
+
+    if st.session_state.analysis_source in ("local", "fallback"):
+        if st.session_state.analysis_source == "fallback":
+            st.warning("⚠️ AI recommendations were unavailable, showing a rule-based ranking instead.")
+        else:
+            st.info("⚡ Quick re-score for your updated profile (no new menu scan needed).")
+        if st.button("🧠 Refresh AI Recommendations", disabled=bool(st.session_state.job_id)):
+            submit_job(user_prefs, prefs_key, dishes_with_nutrition=st.session_state.dishes_with_nutrition,
+                       profile=profile_runs)
+            st.rerun()
+
     # ========================================================================
     # TOP METRICS
     # ========================================================================
@@ -339,6 +462,13 @@ if st.session_state.get('analysis'):
         else:
             st.info("No ranking data available")
 
+if st.session_state.get('analysis'):
+    # Reruns happen on every widget change; only profile one when asked to
+    with profile_run("render", enabled=profile_render) as profiler:
+        render_analysis(st.session_state.analysis)
+    if profiler is not None:
+        st.caption(f"Render profile written to {profiler.paths['collapsed']}")
+
 # ============================================================================
 # FOOTER
 # ============================================================================
@@ -0,0 +1,121 @@
+import functools
+import random
+import time
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_RPM,
+    OPENAI_TPM,
+    OPENAI_QUEUE_TIMEOUT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE_SECONDS,
+    OPENAI_RETRY_MAX_SECONDS,
+    JOB_WORKERS,
+    NUTRITION_MAX_WORKERS,
+    DEBUG_MODE
+)
+from rate_limiter import OpenAIScheduler, estimate_request_tokens
+from deadline import DeadlineExceeded, budget_timeout, deadline_expired, time_remaining
+
+# Errors worth retrying through the scheduler (everything else is raised)
+RETRYABLE_OPENAI_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client():
+    """
+    Shared OpenAI client for the whole process
+
+    One client means one connection pool, reused across sessions and reruns
+    instead of re-negotiating TLS on every call. Retries are done by
+    create_chat_completion so they go through the scheduler.
+    """
+    return openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_session():
+    """Shared HTTP session (keep-alive) for the nutrition APIs"""
+    session = requests.Session()
+    # One connection per USDA lookup or hedge that can be in flight (see nutrition_fetch)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=JOB_WORKERS * NUTRITION_MAX_WORKERS * 2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@functools.lru_cache(maxsize=None)
+def get_openai_scheduler():
+    """Process-wide RPM/TPM scheduler shared by every session"""
+    return OpenAIScheduler(OPENAI_RPM, OPENAI_TPM)
+
+
+def retry_delay(error, attempt):
+    """
+    Seconds to wait before retrying after `error` on the given attempt (0-based)
+
+    Honours the server's retry-after-ms / retry-after header; otherwise
+    full-jitter exponential backoff capped at OPENAI_RETRY_MAX_SECONDS, so
+    sessions that failed together don't retry in lockstep.
+    """
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale + random.uniform(0, OPENAI_RETRY_BASE_SECONDS)
+        except (KeyError, TypeError, ValueError):
+            continue  # missing, or an HTTP date
+
+    return random.uniform(0, min(OPENAI_RETRY_MAX_SECONDS, OPENAI_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def create_chat_completion(**kwargs):
+    """
+    openai chat.completions.create, admitted through the shared scheduler
+
+    Waits for RPM/TPM budget (at the use_priority priority), settles the
+    reservation with the reported usage, and retries rate-limit and
+    transient errors at most OPENAI_MAX_RETRIES times, backing off as
+    retry_delay() says. Under a deadline
+    (see use_deadline) queueing and the request itself only get the time
+    that is left, and no attempt is started once it has passed.
+    """
+    scheduler = get_openai_scheduler()
+    estimate = estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens", 0))
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        if deadline_expired():
+            raise DeadlineExceeded("No time left for the OpenAI request")
+        reserved = scheduler.acquire(estimate, timeout=budget_timeout(OPENAI_QUEUE_TIMEOUT))
+
+        remaining = time_remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                scheduler.settle(reserved, 0)
+                raise DeadlineExceeded("No time left for the OpenAI request")
+            kwargs["timeout"] = remaining
+
+        try:
+            response = get_openai_client().chat.completions.create(**kwargs)
+        except RETRYABLE_OPENAI_ERRORS as e:
+            if isinstance(e, openai.RateLimitError):
+                scheduler.record_rate_limited()
+            scheduler.settle(reserved, reserved)
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            remaining = time_remaining()
+            if remaining is not None and delay >= remaining:
+                raise  # The retry could not start before the deadline
+            if DEBUG_MODE:
+                print(f"⚠ OpenAI {type(e).__name__}, retry {attempt + 1}/{OPENAI_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        # Streams report no usage; keep the estimate
+        usage = getattr(response, "usage", None)
+        scheduler.settle(reserved, usage.total_tokens if usage else reserved)
+        return response
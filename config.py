@@ -5,17 +5,87 @@ import streamlit as st
 # Load environment variables
 load_dotenv()
 
+
+def _secret(name):
+    """Streamlit secret if a secrets file exists, else the environment variable"""
+    try:
+        return st.secrets.get(name, os.getenv(name))
+    except FileNotFoundError:
+        # No secrets.toml, e.g. when running loadtest.py outside Streamlit
+        return os.getenv(name)
+
+
 # API Keys
-OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY"))
-USDA_API_KEY = st.secrets.get("USDA_API_KEY", os.getenv("USDA_API_KEY"))
+OPENAI_API_KEY = _secret("OPENAI_API_KEY")
+USDA_API_KEY = _secret("USDA_API_KEY")
 
 # Application Settings
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False") == "True"
 MAX_DISHES = int(os.getenv("MAX_DISHES", "50"))
 DEFAULT_CALORIE_TARGET = int(os.getenv("DEFAULT_CALORIE_TARGET", "600"))
 
+# Model Cascade (comma-separated, cheapest first; escalate on low confidence)
+VISION_MODELS = [m.strip() for m in os.getenv("VISION_MODELS", "gpt-4o-mini,gpt-4o").split(",") if m.strip()]
+ANALYSIS_MODELS = [m.strip() for m in os.getenv("ANALYSIS_MODELS", "gpt-4o-mini,gpt-4o").split(",") if m.strip()]
+CASCADE_MIN_VALID_RATIO = float(os.getenv("CASCADE_MIN_VALID_RATIO", "0.9"))
+CASCADE_MIN_NAME_COVERAGE = float(os.getenv("CASCADE_MIN_NAME_COVERAGE", "0.8"))
+
+# Stream the first analysis tier's recommendations into the UI as they are
+# generated; if that answer fails the cascade check the preview is cleared and
+# replaced by the escalated (non-streamed) answer
+STREAM_ANALYSIS = os.getenv("STREAM_ANALYSIS", "True") == "True"
+
+# OpenAI Rate Limits (shared by all sessions in this process)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+# Jittered exponential backoff between retries, unless the API sends retry-after
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "0.5"))
+OPENAI_RETRY_MAX_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "20"))
+
+# USDA Client Resilience
+USDA_TIMEOUT = float(os.getenv("USDA_TIMEOUT", "10"))
+USDA_HEDGE_ENABLED = os.getenv("USDA_HEDGE_ENABLED", "True") == "True"
+USDA_HEDGE_PERCENTILE = float(os.getenv("USDA_HEDGE_PERCENTILE", "95"))
+USDA_HEDGE_DEFAULT_DELAY = float(os.getenv("USDA_HEDGE_DEFAULT_DELAY", "1.0"))
+USDA_HEDGE_MIN_SAMPLES = int(os.getenv("USDA_HEDGE_MIN_SAMPLES", "20"))
+USDA_HEDGE_MAX_RATIO = float(os.getenv("USDA_HEDGE_MAX_RATIO", "0.1"))  # outstanding hedges per lookup in flight
+USDA_BREAKER_FAILURES = int(os.getenv("USDA_BREAKER_FAILURES", "5"))
+USDA_BREAKER_RESET_SECONDS = float(os.getenv("USDA_BREAKER_RESET_SECONDS", "30"))
+USDA_CACHE_SIZE = int(os.getenv("USDA_CACHE_SIZE", "2048"))
+
+# Near-duplicate Dish Index (reuses nutrition across restaurants)
+DISH_INDEX_ENABLED = os.getenv("DISH_INDEX_ENABLED", "True") == "True"
+DISH_INDEX_DIR = os.getenv("DISH_INDEX_DIR", ".cache/dish_index")
+DISH_INDEX_DIM = int(os.getenv("DISH_INDEX_DIM", "1024"))
+DISH_INDEX_THRESHOLD = float(os.getenv("DISH_INDEX_THRESHOLD", "0.85"))  # see tests/test_dish_index.py
+
+# Background Analysis Jobs
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", ".cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+# Request Deadline (end-to-end budget per analysis, 0 disables; see deadline.py)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+NUTRITION_BUDGET_SECONDS = float(os.getenv("NUTRITION_BUDGET_SECONDS", "15"))  # kept back from extraction
+ANALYSIS_BUDGET_SECONDS = float(os.getenv("ANALYSIS_BUDGET_SECONDS", "30"))  # kept back from earlier stages
+ANALYSIS_MIN_SECONDS = float(os.getenv("ANALYSIS_MIN_SECONDS", "5"))  # less left: rule-based fallback
+NUTRITION_MAX_WORKERS = int(os.getenv("NUTRITION_MAX_WORKERS", "4"))
+
+# Restaurant Menu Store (menu updates only look up changed dishes)
+MENU_STORE_PATH = os.getenv("MENU_STORE_PATH", ".cache/menus.sqlite3")
+MENU_STORE_KEEP_VERSIONS = int(os.getenv("MENU_STORE_KEEP_VERSIONS", "5"))
+
+# Profiling (per-run CPU samples + allocation reports, see profiling.py)
+PROFILE_MODE = os.getenv("PROFILE_MODE", "False") == "True"
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25"))
+
 # API Endpoints
-USDA_SEARCH_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # e.g. a local fake_apis server
+USDA_SEARCH_URL = os.getenv("USDA_SEARCH_URL", "https://api.nal.usda.gov/fdc/v1/foods/search")
 
 # Dietary Goals
 GOALS = {
@@ -45,6 +115,38 @@ if MAX_DISHES <= 0:
     raise ValueError("MAX_DISHES must be a positive integer")
 if DEFAULT_CALORIE_TARGET <= 0:
     raise ValueError("DEFAULT_CALORIE_TARGET must be a positive integer")
+if not VISION_MODELS or not ANALYSIS_MODELS:
+    raise ValueError("VISION_MODELS and ANALYSIS_MODELS must list at least one model")
+if not 0 <= CASCADE_MIN_VALID_RATIO <= 1 or not 0 <= CASCADE_MIN_NAME_COVERAGE <= 1:
+    raise ValueError("CASCADE_MIN_VALID_RATIO and CASCADE_MIN_NAME_COVERAGE must be between 0 and 1")
+if OPENAI_RPM <= 0 or OPENAI_TPM <= 0:
+    raise ValueError("OPENAI_RPM and OPENAI_TPM must be positive integers")
+if OPENAI_MAX_RETRIES < 0:
+    raise ValueError("OPENAI_MAX_RETRIES must be zero or more")
+if OPENAI_RETRY_BASE_SECONDS < 0 or OPENAI_RETRY_MAX_SECONDS < OPENAI_RETRY_BASE_SECONDS:
+    raise ValueError("OPENAI_RETRY_BASE_SECONDS must be non-negative and at most OPENAI_RETRY_MAX_SECONDS")
+if USDA_TIMEOUT <= 0 or USDA_HEDGE_DEFAULT_DELAY < 0 or USDA_BREAKER_RESET_SECONDS < 0:
+    raise ValueError("USDA_TIMEOUT must be positive and USDA hedge/breaker delays non-negative")
+if not 0 < USDA_HEDGE_PERCENTILE <= 100:
+    raise ValueError("USDA_HEDGE_PERCENTILE must be between 0 and 100")
+if not 0 <= USDA_HEDGE_MAX_RATIO <= 1:
+    raise ValueError("USDA_HEDGE_MAX_RATIO must be between 0 and 1")
+if USDA_BREAKER_FAILURES <= 0:
+    raise ValueError("USDA_BREAKER_FAILURES must be a positive integer")
+if DISH_INDEX_DIM <= 0:
+    raise ValueError("DISH_INDEX_DIM must be a positive integer")
+if not 0 < DISH_INDEX_THRESHOLD <= 1:
+    raise ValueError("DISH_INDEX_THRESHOLD must be between 0 and 1")
+if JOB_WORKERS <= 0:
+    raise ValueError("JOB_WORKERS must be a positive integer")
+if min(REQUEST_DEADLINE_SECONDS, NUTRITION_BUDGET_SECONDS, ANALYSIS_BUDGET_SECONDS, ANALYSIS_MIN_SECONDS) < 0:
+    raise ValueError("Deadline and stage budget settings must be non-negative")
+if NUTRITION_MAX_WORKERS <= 0:
+    raise ValueError("NUTRITION_MAX_WORKERS must be a positive integer")
+if MENU_STORE_KEEP_VERSIONS <= 0:
+    raise ValueError("MENU_STORE_KEEP_VERSIONS must be a positive integer")
+if PROFILE_SAMPLE_INTERVAL_MS <= 0 or PROFILE_TOP_ALLOCATIONS <= 0:
+    raise ValueError("PROFILE_SAMPLE_INTERVAL_MS and PROFILE_TOP_ALLOCATIONS must be positive")
 if DEBUG_MODE:
     print("Debug mode is enabled")
 if DEBUG_MODE:
@@ -0,0 +1,61 @@
+import contextlib
+import contextvars
+import time
+
+# Absolute time.monotonic() by which the current request must finish, or None
+_current_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's time budget ran out before a call could be made"""
+
+
+@contextlib.contextmanager
+def use_deadline(seconds=None, reserve=0.0):
+    """
+    Run the block under a deadline, never extending an enclosing one
+
+    Args:
+        seconds: Budget from now, None for no budget of its own
+        reserve: Seconds of the enclosing deadline kept back for later
+            stages; a stage still gets at least half of the time left
+
+    Calls in the block size their timeouts with budget_timeout(). Worker
+    threads only see the deadline if run via contextvars.copy_context().
+    """
+    now = time.monotonic()
+    candidates = []
+    if seconds is not None:
+        candidates.append(now + seconds)
+
+    outer = _current_deadline.get()
+    if outer is not None:
+        left = max(outer - now, 0.0)
+        candidates.append(outer - min(reserve, left / 2))
+
+    token = _current_deadline.set(min(candidates) if candidates else None)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def time_remaining():
+    """Seconds left in the current deadline (0 when passed), or None without one"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def deadline_expired():
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def budget_timeout(default):
+    """The stage's own timeout, shortened to what is left of the deadline"""
+    remaining = time_remaining()
+    if remaining is None:
+        return default
+    return remaining if default is None else min(default, remaining)
@@ -0,0 +1,221 @@
+import json
+import os
+import re
+import threading
+import zlib
+import numpy as np
+
+# Words that describe presentation rather than the food itself
+STOPWORDS = {"w", "with", "and", "the", "of", "a", "in", "on", "served", "our", "fresh", "house",
+             "topped", "alla", "al", "la", "le", "de", "di", "style"}
+
+# Everything after these is an accompaniment ("Salmon w/ Lemon Butter")
+ACCOMPANIMENT_MARKERS = {"w", "with", "served", "topped"}
+
+# Preparation/origin words: they count, but much less than the food itself
+MODIFIERS = {"grilled", "roasted", "baked", "steamed", "seared", "braised", "atlantic", "wild",
+             "organic", "homemade", "classic", "signature", "special", "traditional", "famous",
+             "original", "regular"}
+
+# A protein only one of two names has means a different dish ("Chicken Caesar Salad")
+PROTEINS = {"chicken", "beef", "pork", "lamb", "turkey", "duck", "bacon", "ham", "sausage", "steak",
+            "salmon", "tuna", "cod", "fish", "shrimp", "prawn", "crab", "lobster", "tofu", "egg"}
+
+HEAD_WEIGHT = 3.0
+WORD_WEIGHT = 1.0
+MODIFIER_WEIGHT = 0.5
+ACCOMPANIMENT_WEIGHT = 0.25
+
+
+def _tokens(dish_name):
+    return [w for w in re.findall(r"[a-z]+", dish_name.lower()) if w not in STOPWORDS]
+
+
+def _singular(word):
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _weighted_tokens(dish_name):
+    """
+    Returns:
+        tuple: ({token: weight}, head) where the head noun is the last
+        non-modifier word before any accompaniment
+    """
+    main, extras = [], []
+    part = main
+    for word in re.findall(r"[a-z]+", dish_name.lower()):
+        if word in ACCOMPANIMENT_MARKERS:
+            part = extras
+        elif word not in STOPWORDS:
+            part.append(_singular(word))
+
+    weights = {word: ACCOMPANIMENT_WEIGHT for word in extras}
+    for word in main:
+        weights[word] = MODIFIER_WEIGHT if word in MODIFIERS else WORD_WEIGHT
+    head = next((word for word in reversed(main) if word not in MODIFIERS), None)
+    if head is not None:
+        weights[head] = HEAD_WEIGHT
+    return weights, head
+
+
+def dish_name_similarity(name, other):
+    """
+    How safely two dish names can share nutrition, from 0 to 1
+
+    Weighted token containment in both directions (the smaller wins), so
+    words only one name has pull the score down. Different head nouns
+    ("Fried Chicken" vs "Chicken Fried Rice") or a protein only one name
+    has ("Caesar Salad" vs "Chicken Caesar Salad") score 0.
+    """
+    weights, head = _weighted_tokens(name)
+    other_weights, other_head = _weighted_tokens(other)
+    if head is None or other_head is None:
+        return 0.0
+    if head not in other_weights or other_head not in weights:
+        return 0.0
+    if (weights.keys() ^ other_weights.keys()) & PROTEINS:
+        return 0.0
+
+    shared = weights.keys() & other_weights.keys()
+    return min(
+        sum(weights[w] for w in shared) / sum(weights.values()),
+        sum(other_weights[w] for w in shared) / sum(other_weights.values())
+    )
+
+
+def vectorize_dish_name(dish_name, dim):
+    """
+    Hashed bag of words + character trigrams, L2-normalized
+
+    Word order is ignored and trigrams are taken per word ("<salmon>"), so
+    "Salmon, grilled" and "Grilled Atlantic Salmon" land close together.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _tokens(dish_name):
+        vector[zlib.crc32(f"w:{word}".encode()) % dim] += 1.0
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode()) % dim] += 0.5
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class DishIndex:
+    """
+    Persistent nearest-neighbor index of dishes we already have nutrition for
+
+    Storage is append-only: `vectors.f32` holds raw float32 rows and
+    `entries.jsonl` the matching {name, nutrition} records. At startup the
+    vector file is memory-mapped; rows added later are appended to both
+    files and kept in memory until the next remap.
+
+    Search is a single matrix-vector product (cosine similarity on
+    normalized rows), which at menu-database sizes is faster than building
+    and maintaining an approximate structure. The closest CANDIDATES rows
+    are then re-scored with dish_name_similarity, since similar spelling
+    alone doesn't mean similar food.
+    """
+
+    REMAP_EVERY = 256
+    CANDIDATES = 10
+
+    def __init__(self, directory, dim=1024):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._entries_path = os.path.join(directory, "entries.jsonl")
+        self._entries = []
+        self._names = set()
+        self._mapped = np.zeros((0, dim), dtype=np.float32)
+        self._pending = []
+        self._load()
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        torn = False
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        torn = True  # Partial write from a crash
+                        break
+
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        rows = size // (4 * self.dim)
+
+        # Only trust rows present in both files, and cut any torn tail so
+        # later appends stay aligned
+        count = min(rows, len(self._entries))
+        if size != count * 4 * self.dim:
+            os.truncate(self._vectors_path, count * 4 * self.dim)
+        if torn or len(self._entries) > count:
+            self._entries = self._entries[:count]
+            with open(self._entries_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e) + "\n" for e in self._entries)
+        self._names = {e["name"].lower() for e in self._entries}
+        self._remap(count)
+
+    def _remap(self, count):
+        if count:
+            self._mapped = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+        self._pending = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, dish_name):
+        """
+        Returns:
+            tuple: (entry, similarity) for the most similar dish (see
+            dish_name_similarity), or (None, 0.0)
+        """
+        query = vectorize_dish_name(dish_name, self.dim)
+        if not query.any():
+            return None, 0.0
+
+        with self._lock:
+            if not self._entries:
+                return None, 0.0
+            scores = self._mapped @ query if len(self._mapped) else np.zeros(0, dtype=np.float32)
+            if self._pending:
+                scores = np.concatenate([scores, np.stack(self._pending) @ query])
+            k = min(self.CANDIDATES, len(scores))
+            candidates = np.argpartition(-scores, k - 1)[:k]
+            entries = [self._entries[int(i)] for i in candidates]
+
+        best, best_score = None, 0.0
+        for entry in entries:
+            score = dish_name_similarity(dish_name, entry["name"])
+            if score > best_score:
+                best, best_score = entry, score
+        return best, best_score
+
+    def add(self, dish_name, nutrition):
+        """Append a resolved dish (ignored if the exact name is already indexed)"""
+        vector = vectorize_dish_name(dish_name, self.dim)
+        if not vector.any():
+            return
+
+        with self._lock:
+            if dish_name.lower() in self._names:
+                return
+
+            # Vector first: a row without an entry is dropped on load
+            with open(self._vectors_path, "ab") as f:
+                f.write(vector.tobytes())
+            with open(self._entries_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"name": dish_name, "nutrition": nutrition}) + "\n")
+
+            self._entries.append({"name": dish_name, "nutrition": nutrition})
+            self._names.add(dish_name.lower())
+            self._pending.append(vector)
+
+            if len(self._pending) >= self.REMAP_EVERY:
+                self._remap(len(self._entries))
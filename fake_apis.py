@@ -0,0 +1,346 @@
+"""
+Local stand-ins for the external APIs, for testing without keys or spend
+
+Run standalone:
+    python fake_apis.py --port 8787 --rpm 60 --tpm 20000 --latency lognormal:0.8,0.4
+then point the app at them with
+    OPENAI_BASE_URL=http://127.0.0.1:8787/v1
+    USDA_SEARCH_URL=http://127.0.0.1:8788/fdc/v1/foods/search
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FAKE_MENU = [
+    {"name": "Grilled Salmon", "description": "Atlantic salmon with roasted vegetables and lemon butter",
+     "price": "$24.99", "category": "main"},
+    {"name": "Caesar Salad", "description": "Romaine lettuce, parmesan, croutons, Caesar dressing",
+     "price": "$12.99", "category": "appetizer"},
+    {"name": "Chicken Breast", "description": "Grilled chicken breast with herbs",
+     "price": "$18.99", "category": "main"},
+    {"name": "Beef Burger", "description": "Beef patty, cheddar, brioche bun",
+     "price": "$16.50", "category": "main"},
+    {"name": "Vegetable Soup", "description": "Seasonal vegetables in tomato broth",
+     "price": "$8.00", "category": "appetizer"},
+    {"name": "French Fries", "description": "No description provided",
+     "price": "$5.00", "category": "side"},
+    {"name": "Chocolate Cake", "description": "Dark chocolate sponge with ganache",
+     "price": "$9.00", "category": "dessert"},
+    {"name": "Iced Tea", "description": "No description provided",
+     "price": "$3.50", "category": "beverage"},
+]
+
+MENU_LINE = re.compile(r"^- (.+?): (\d+) cal, ([\d.]+)g protein", re.MULTILINE)
+
+
+def parse_latency(spec):
+    """
+    Build a latency sampler from a short spec
+
+    "0.5" (constant seconds), "uniform:0.2,1.0", "exp:0.5" (mean),
+    "lognormal:0.8,0.4" (median, sigma) - the last gives realistic long tails.
+    """
+    if callable(spec):
+        return spec
+    spec = str(spec)
+    if ":" not in spec:
+        value = float(spec)
+        return lambda: value
+
+    kind, args = spec.split(":", 1)
+    params = [float(a) for a in args.split(",")]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1 / params[0])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"Unknown latency distribution: {kind}")
+
+
+class _Limiter:
+    """Sliding one-minute window of (time, tokens), like the real API enforces"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.lock = threading.Lock()
+        self.events = deque()
+
+    def admit(self, tokens):
+        if not self.rpm and not self.tpm:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            while self.events and now - self.events[0][0] > 60:
+                self.events.popleft()
+            if self.rpm and len(self.events) + 1 > self.rpm:
+                return False
+            if self.tpm and sum(t for _, t in self.events) + tokens > self.tpm:
+                return False
+            self.events.append((now, tokens))
+            return True
+
+
+def _fake_analysis(prompt):
+    """Deterministic analysis JSON covering every dish listed in the prompt"""
+    dishes = [(name, int(cal), float(protein)) for name, cal, protein in MENU_LINE.findall(prompt)]
+    dishes.sort(key=lambda d: d[2], reverse=True)
+    return {
+        "top_picks": [
+            {"name": name, "why_good": "High protein", "nutrition_highlights": f"{protein}g protein, {cal} calories"}
+            for name, cal, protein in dishes[:3]
+        ],
+        "meal_combos": [],
+        "ranked_dishes": [
+            {"name": name, "rank": i + 1, "score": max(0, 95 - i * 5), "reason": f"{protein}g protein"}
+            for i, (name, cal, protein) in enumerate(dishes)
+        ],
+        "avoid": [],
+        "allergen_warnings": [],
+        "general_advice": "Fake analysis from the local test server."
+    }
+
+
+def _fake_food(query):
+    """Deterministic USDA search hit, derived from the query text"""
+    seed = zlib.crc32(query.lower().encode())
+    return {
+        "description": query.upper(),
+        "foodNutrients": [
+            {"nutrientName": "Energy", "value": 80 + seed % 400},
+            {"nutrientName": "Protein", "value": (seed >> 3) % 35},
+            {"nutrientName": "Carbohydrate, by difference", "value": (seed >> 5) % 60},
+            {"nutrientName": "Total lipid (fat)", "value": (seed >> 7) % 30},
+            {"nutrientName": "Fiber, total dietary", "value": (seed >> 9) % 8},
+            {"nutrientName": "Sugars, total including NLEA", "value": (seed >> 11) % 25},
+            {"nutrientName": "Sodium, Na", "value": (seed >> 13) % 900},
+        ]
+    }
+
+
+def _message_text(messages):
+    parts = []
+    has_image = False
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                has_image = True
+            else:
+                parts.append(part.get("text", ""))
+    return "\n".join(parts), has_image
+
+
+class _FakeServer:
+    """
+    Threaded local HTTP server with injectable latency and errors
+
+    Args:
+        latency: Seconds per request, a parse_latency spec, or fn() -> seconds
+        error_rate: Fraction of requests answered with a 500
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, host="127.0.0.1", port=0):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.counts = {"requests": 0, "rate_limited": 0, "errors": 0}
+        self._counts_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, key):
+        with self._counts_lock:
+            self.counts[key] += 1
+
+    def _inject(self, handler):
+        """Sleep for the sampled latency; True if this request should fail"""
+        time.sleep(max(0.0, self.latency()))
+        if random.random() < self.error_rate:
+            self._count("errors")
+            handler.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return True
+        return False
+
+    def handle_get(self, handler):
+        handler.send_json(404, {"error": {"message": "not found"}})
+
+    def handle_post(self, handler):
+        handler.send_json(404, {"error": {"message": "not found"}})
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up on the request (e.g. its deadline passed)
+
+            def send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server._count("requests")
+                server.handle_get(self)
+
+            def do_POST(self):
+                server._count("requests")
+                server.handle_post(self)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeOpenAIServer(_FakeServer):
+    """
+    Minimal /v1/chat/completions server with OpenAI-style rate limits
+
+    Image requests get FAKE_MENU back, text requests a fake analysis of the
+    dishes in the prompt. Supports stream=True (SSE chunks).
+
+    Args:
+        rpm, tpm: Limits enforced with 429 responses (None = unlimited)
+    """
+
+    def __init__(self, rpm=None, tpm=None, latency=0.0, error_rate=0.0, host="127.0.0.1", port=0):
+        self.limiter = _Limiter(rpm, tpm)
+        super().__init__(latency, error_rate, host, port)
+
+    @property
+    def base_url(self):
+        return f"{self.address}/v1"
+
+    def handle_post(self, handler):
+        request = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
+        if not handler.path.endswith("/chat/completions"):
+            handler.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        text, has_image = _message_text(request.get("messages", []))
+        tokens = len(text) // 4 + (1105 if has_image else 0) + request.get("max_tokens", 0)
+
+        if not self.limiter.admit(tokens):
+            self._count("rate_limited")
+            handler.send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                              {"retry-after": "1"})
+            return
+
+        if self._inject(handler):
+            return
+
+        content = json.dumps(FAKE_MENU if has_image else _fake_analysis(text))
+        model = request.get("model", "fake-model")
+        created = int(time.time())
+
+        if request.get("stream"):
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/event-stream")
+            handler.send_header("Connection", "close")
+            handler.end_headers()
+            for i in range(0, len(content), 40):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": {"content": content[i:i + 40]},
+                                                      "finish_reason": None}]}
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.close_connection = True
+            return
+
+        completion_tokens = len(content) // 4
+        handler.send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(text) // 4, "completion_tokens": completion_tokens,
+                      "total_tokens": len(text) // 4 + completion_tokens}
+        })
+
+
+class FakeUSDAServer(_FakeServer):
+    """FoodData Central /foods/search stand-in with deterministic nutrients"""
+
+    @property
+    def search_url(self):
+        return f"{self.address}/fdc/v1/foods/search"
+
+    def handle_get(self, handler):
+        url = urlparse(handler.path)
+        if not url.path.endswith("/foods/search"):
+            handler.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        if self._inject(handler):
+            return
+
+        query = parse_qs(url.query).get("query", [""])[0]
+        handler.send_json(200, {"foods": [_fake_food(query)] if query else []})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local fake API servers")
+    parser.add_argument("--port", type=int, default=8787, help="OpenAI port (USDA uses port + 1)")
+    parser.add_argument("--rpm", type=int, default=None)
+    parser.add_argument("--tpm", type=int, default=None)
+    parser.add_argument("--latency", default="0.5", help="OpenAI latency spec, see parse_latency")
+    parser.add_argument("--usda-latency", default="0.2", help="USDA latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake_openai = FakeOpenAIServer(args.rpm, args.tpm, args.latency, args.error_rate, port=args.port).start()
+    fake_usda = FakeUSDAServer(args.usda_latency, args.error_rate, port=args.port + 1).start()
+    print(f"Fake OpenAI: {fake_openai.base_url}")
+    print(f"Fake USDA:   {fake_usda.search_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake_openai.stop()
+        fake_usda.stop()
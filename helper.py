@@ -79,4 +79,12 @@ def check_allergens(dish_name, description, allergen_list):
         if any(keyword in text for keyword in keywords):
             detected.append(allergen)
 
-    return detected
\ No newline at end of file
+    return detected
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (0 if empty)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
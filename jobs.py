@@ -0,0 +1,250 @@
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import JOBS_DB_PATH, JOB_WORKERS, JOB_RETENTION_HOURS, REQUEST_DEADLINE_SECONDS, DEBUG_MODE
+import pipeline
+from menu_store import get_menu_store
+from profiling import profile_run
+from deadline import use_deadline
+
+ACTIVE_STATUSES = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    dedup_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    partial TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, created_at);
+"""
+
+
+def _is_degraded(result):
+    """Whether a finished job's result was cut down (fallback analysis, dishes skipped for time)"""
+    return result["analysis"].get("source") == "fallback" or bool(result.get("skipped"))
+
+
+class JobQueue:
+    """
+    Menu analyses run on a worker pool, with state kept in SQLite
+
+    The Streamlit script only submits a job and polls its row, so reruns and
+    widget changes never cancel (or repeat) the API work. Identical requests
+    (same image or menu, same profile) attach to the existing job.
+
+    Job rows: status queued → running → done | failed, with the current
+    stage (extracting, nutrition, analysis), its progress, streamed partial
+    recommendations and finally the result JSON.
+
+    Each job has REQUEST_DEADLINE_SECONDS from submission, time spent
+    queued included; the stages degrade to fit it (see pipeline.py).
+    """
+
+    def __init__(self, db_path, workers=4, retention_hours=24):
+        self.db_path = db_path
+        self.retention_hours = retention_hours
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Jobs from a previous process can't resume: their inputs lived in memory
+            conn.execute(
+                "UPDATE jobs SET status='failed', error='Interrupted by server restart', updated_at=? "
+                f"WHERE status IN {ACTIVE_STATUSES}",
+                (time.time(),)
+            )
+            conn.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - retention_hours * 3600,))
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis-job")
+        self._submit_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Short-lived connection per operation (safe across worker threads)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name}=?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id=?", (*fields.values(), job_id))
+
+    def submit(self, user_prefs, image_bytes=None, dishes_with_nutrition=None, restaurant=None, profile=None):
+        """
+        Queue an analysis from a menu image, or re-analyze known dishes
+
+        With a restaurant, the extracted menu is stored as its new version
+        and only added or changed dishes are looked up (see MenuStore).
+        With profile (default: PROFILE_MODE), the run is profiled (see profiling.py).
+
+        Returns:
+            str: Job ID (an existing one if the same request is queued, running, or
+            done with an LLM analysis of every dish)
+        """
+        if image_bytes is None and dishes_with_nutrition is None:
+            raise ValueError("Either image_bytes or dishes_with_nutrition is required")
+
+        source = pipeline.image_digest(image_bytes) if image_bytes is not None \
+            else pipeline.analysis_key(dishes_with_nutrition, {})
+        dedup_key = hashlib.sha256(
+            f"{source}:{restaurant or ''}:{bool(profile)}:{json.dumps(user_prefs, sort_keys=True)}".encode()
+        ).hexdigest()
+
+        with self._submit_lock:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT id, result FROM jobs WHERE dedup_key=? AND status != 'failed' "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (dedup_key,)
+                ).fetchone()
+                # A degraded result (rule-based fallback, dishes skipped for
+                # time) isn't reused: like pipeline.analyze, retry the LLM
+                if row and not (row[1] and _is_degraded(json.loads(row[1]))):
+                    return row[0]
+
+                job_id = uuid.uuid4().hex
+                now = time.time()
+                conn.execute(
+                    "INSERT INTO jobs (id, dedup_key, status, stage, created_at, updated_at) "
+                    "VALUES (?, ?, 'queued', 'queued', ?, ?)",
+                    (job_id, dedup_key, now, now)
+                )
+
+        deadline_at = time.monotonic() + REQUEST_DEADLINE_SECONDS if REQUEST_DEADLINE_SECONDS else None
+        # Pool threads don't inherit context; carry the caller's (e.g. use_priority(BATCH)) over
+        self._executor.submit(contextvars.copy_context().run, self._run, job_id, user_prefs, image_bytes,
+                              dishes_with_nutrition, restaurant, profile, deadline_at)
+        return job_id
+
+    def _run(self, job_id, user_prefs, image_bytes, dishes_with_nutrition, restaurant=None, profile=None,
+             deadline_at=None):
+        budget = None if deadline_at is None else deadline_at - time.monotonic()
+        with profile_run(f"job-{job_id[:8]}", enabled=profile), use_deadline(budget):
+            self._run_pipeline(job_id, user_prefs, image_bytes, dishes_with_nutrition, restaurant)
+
+    def _run_pipeline(self, job_id, user_prefs, image_bytes, dishes_with_nutrition, restaurant):
+        dishes = None
+        menu_update = None
+        skipped = None  # names of dishes the deadline left without nutrition; None: no lookups
+        partial = {"top_picks": [], "meal_combos": [], "ranked_dishes": []}
+
+        def on_progress(done, total):
+            self._update(job_id, progress=done / total)
+
+        try:
+            if dishes_with_nutrition is None:
+                digest = pipeline.image_digest(image_bytes)
+                latest = get_menu_store().latest(restaurant) if restaurant else None
+
+                if latest and latest["image_digest"] == digest:
+                    # Same photo as the stored version: nothing to extract or look up
+                    dishes_with_nutrition = latest["dishes_with_nutrition"]
+                    menu_update = {"version": latest["version"], "unchanged_image": True}
+                    skipped = []
+                else:
+                    self._update(job_id, status="running", stage="extracting", progress=0,
+                                 message="Reading menu with the vision model...")
+                    dishes = pipeline.extract_dishes(image_bytes)
+
+                    self._update(job_id, stage="nutrition", progress=0,
+                                 message=f"Found {len(dishes)} dishes, fetching nutrition...")
+                    if restaurant:
+                        ingested = get_menu_store().ingest(restaurant, dishes, digest, on_progress=on_progress)
+                        dishes_with_nutrition = ingested["dishes_with_nutrition"]
+                        skipped = ingested["skipped"]
+                        menu_update = {
+                            "version": ingested["version"],
+                            "fetched": ingested["fetched"],
+                            **{change: len(names) for change, names in ingested["diff"].items()}
+                        }
+                    else:
+                        skipped = []
+                        dishes_with_nutrition = pipeline.fetch_nutrition(
+                            dishes, on_progress=on_progress, on_skipped=lambda dish: skipped.append(dish['name'])
+                        )
+
+                if not dishes_with_nutrition:
+                    raise LookupError("Could not find nutrition data for any dishes")
+
+            self._update(job_id, status="running", stage="analysis", progress=0,
+                         message="Generating personalized recommendations...")
+
+            def on_item(section, item):
+                if section == "reset":
+                    # The streamed tier was rejected; a stronger model is answering
+                    for entries in partial.values():
+                        entries.clear()
+                    self._update(job_id, partial=json.dumps(partial),
+                                 message="Double-checking recommendations with a stronger model...")
+                elif section in partial:
+                    partial[section].append(item)
+                    self._update(job_id, partial=json.dumps(partial))
+
+            analysis = pipeline.analyze(dishes_with_nutrition, user_prefs, on_item=on_item)
+
+            result = {
+                "dishes": dishes,
+                "dishes_with_nutrition": dishes_with_nutrition,
+                "analysis": analysis,
+                "menu_update": menu_update,
+                "skipped": skipped
+            }
+            self._update(job_id, status="done", stage="done", progress=1, message=None,
+                         result=json.dumps(result))
+
+        except Exception as e:
+            if DEBUG_MODE:
+                print(f"Job {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e))
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict: Job state with decoded partial/result, or None if unknown
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["partial"] = json.loads(job["partial"]) if job["partial"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def metrics(self):
+        """Job counts by status"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+@functools.lru_cache(maxsize=None)
+def get_job_queue():
+    """Process-wide job queue shared by all sessions"""
+    return JobQueue(JOBS_DB_PATH, workers=JOB_WORKERS, retention_hours=JOB_RETENTION_HOURS)
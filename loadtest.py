@@ -0,0 +1,291 @@
+"""
+Concurrent load test of the menu analysis pipeline against local fake APIs
+
+Drives extract_dishes → fetch_nutrition → analyze (see pipeline.py) with
+no API keys or spend, and reports throughput, per-stage p50/p95/p99,
+memory growth and the saturation point.
+
+Examples:
+    # closed loop: sweep concurrency levels, 40 analyses each
+    python loadtest.py --sweep 1,2,4,8,16 --requests 40
+
+    # open loop: Poisson arrivals at 3 req/s, long-tailed OpenAI latency
+    python loadtest.py --rate 3 --duration 60 --openai-latency lognormal:1.5,0.5
+
+    # end-to-end deadline of 20s: stages degrade instead of running long
+    python loadtest.py --sweep 1,4,16 --deadline 20
+
+    # save a report, then compare the next release against it
+    python loadtest.py --sweep 1,4,16 --json before.json
+    python loadtest.py --sweep 1,4,16 --baseline before.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from deadline import use_deadline
+from fake_apis import FakeOpenAIServer, FakeUSDAServer
+from helper import percentile
+
+STAGES = ("extraction", "nutrition", "analysis", "total")
+
+# Scheduler budget standing in for "no limit", like the fake server without --rpm/--tpm
+UNLIMITED = 10 ** 9
+
+TEST_PREFS = {
+    "goal": "muscle_gain",
+    "diet_type": "none",
+    "allergies": [],
+    "calorie_target": 700
+}
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (peak RSS if /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class LoadResults:
+    """Thread-safe collection of per-request stage timings and failures"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {stage: [] for stage in STAGES}
+        self.queue_waits = []
+        self.errors = {}
+
+    def record(self, timings, queue_wait=0.0):
+        with self._lock:
+            for stage, seconds in timings.items():
+                self.timings[stage].append(seconds)
+            self.queue_waits.append(queue_wait)
+
+    def record_error(self, stage, error):
+        with self._lock:
+            key = f"{stage}: {type(error).__name__}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def summary(self, elapsed):
+        with self._lock:
+            completed = len(self.timings["total"])
+            report = {
+                "completed": completed,
+                "failed": sum(self.errors.values()),
+                "errors": dict(self.errors),
+                "throughput_rps": round(completed / elapsed, 3) if elapsed else 0.0,
+                "queue_wait_p95_ms": round(percentile(sorted(self.queue_waits), 95) * 1000),
+            }
+            for stage in STAGES:
+                values = sorted(self.timings[stage])
+                report[stage] = {
+                    f"p{p}_ms": round(percentile(values, p) * 1000) for p in (50, 95, 99)
+                }
+            return report
+
+
+def run_pipeline_once(pipeline, image_bytes, results, cold, queued_at=None, deadline_seconds=None):
+    """One full menu analysis, timed per stage"""
+    started = time.perf_counter()
+    queue_wait = started - queued_at if queued_at else 0.0
+    timings = {}
+    stage = "extraction"
+    budget = None if deadline_seconds is None else deadline_seconds - queue_wait
+
+    try:
+        with use_deadline(budget):
+            if cold:
+                pipeline.clear_caches()
+
+            t = time.perf_counter()
+            dishes = pipeline.extract_dishes(image_bytes)
+            timings["extraction"] = time.perf_counter() - t
+
+            stage = "nutrition"
+            t = time.perf_counter()
+            dishes_with_nutrition = pipeline.fetch_nutrition(dishes)
+            timings["nutrition"] = time.perf_counter() - t
+            if not dishes_with_nutrition:
+                raise LookupError("no nutrition data")
+
+            stage = "analysis"
+            t = time.perf_counter()
+            analysis = pipeline.analyze(dishes_with_nutrition, TEST_PREFS)
+            timings["analysis"] = time.perf_counter() - t
+            if analysis.get("source") == "fallback":
+                raise RuntimeError("LLM analysis fell back to rules")
+
+            # Include queueing: that's what an arriving user experiences
+            timings["total"] = time.perf_counter() - started + queue_wait
+            results.record(timings, queue_wait)
+    except Exception as e:
+        results.record_error(stage, e)
+
+
+def run_closed_loop(pipeline, concurrency, requests, cold, deadline_seconds=None):
+    """`concurrency` virtual users each running analyses back to back"""
+    results = LoadResults()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(requests):
+            executor.submit(run_pipeline_once, pipeline, _fake_image(i), results, cold, None, deadline_seconds)
+    return results.summary(time.perf_counter() - start)
+
+
+def run_open_loop(pipeline, rate, duration, max_concurrency, cold, deadline_seconds=None):
+    """Poisson arrivals at `rate` per second for `duration` seconds"""
+    results = LoadResults()
+    futures = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        i = 0
+        while time.perf_counter() - start < duration:
+            futures.append(executor.submit(
+                run_pipeline_once, pipeline, _fake_image(i), results, cold, time.perf_counter(), deadline_seconds
+            ))
+            i += 1
+            time.sleep(random.expovariate(rate))
+        wait(futures)
+    return results.summary(time.perf_counter() - start)
+
+
+def _fake_image(i):
+    # Distinct bytes per request so extraction is never served from memo
+    return b"\x89PNG\r\n\x1a\n" + f"load-test-menu-{i}-{random.random()}".encode()
+
+
+def find_saturation(levels):
+    """
+    First concurrency level past which adding load stops paying off:
+    throughput grows < 10% or total p95 latency more than doubles
+    compared to the lowest level.
+    """
+    if len(levels) < 2:
+        return None
+    base_p95 = levels[0]["total"]["p95_ms"] or 1
+    for previous, level in zip(levels, levels[1:]):
+        gain = level["throughput_rps"] / previous["throughput_rps"] if previous["throughput_rps"] else 0
+        if gain < 1.1 or level["total"]["p95_ms"] > 2 * base_p95:
+            return previous["concurrency"]
+    return None
+
+
+def print_report(report, baseline=None):
+    baseline_levels = {lvl["concurrency"]: lvl for lvl in (baseline or {}).get("levels", [])}
+    header = f"{'conc':>5} {'ok':>5} {'fail':>5} {'rps':>7} " + " ".join(
+        f"{stage + ' p50/p95/p99':>26}" for stage in STAGES
+    )
+    print(header)
+    for level in report["levels"]:
+        cells = " ".join(
+            f"{level[s]['p50_ms']:>8}/{level[s]['p95_ms']:>7}/{level[s]['p99_ms']:>8}ms" for s in STAGES
+        )
+        line = f"{level['concurrency']:>5} {level['completed']:>5} {level['failed']:>5} " \
+               f"{level['throughput_rps']:>7} {cells}"
+        before = baseline_levels.get(level["concurrency"])
+        if before:
+            line += f"   Δrps {level['throughput_rps'] - before['throughput_rps']:+.2f}" \
+                    f" Δp95 {level['total']['p95_ms'] - before['total']['p95_ms']:+d}ms"
+        print(line)
+        if level["errors"]:
+            print(f"      errors: {level['errors']}")
+
+    print(f"\nMemory: {report['memory']['rss_start_mb']:.1f} MB → {report['memory']['rss_end_mb']:.1f} MB "
+          f"({report['memory']['growth_mb']:+.1f} MB)")
+    print(f"Saturation point: {report['saturation_concurrency'] or 'not reached'}")
+    print(f"Fake OpenAI: {report['fake_openai']}  Fake USDA: {report['fake_usda']}")
+    budget = report.get("openai_budget", {})
+    print("OpenAI budget (fake server and scheduler): "
+          + ", ".join(f"{budget.get(unit) or 'unlimited'} {unit.upper()}" for unit in ("rpm", "tpm")))
+    print(f"OpenAI scheduler: {report['openai_scheduler']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sweep", default="1,2,4,8", help="Closed-loop concurrency levels, comma-separated")
+    parser.add_argument("--requests", type=int, default=20, help="Analyses per concurrency level")
+    parser.add_argument("--rate", type=float, default=None, help="Open-loop arrivals per second (overrides --sweep)")
+    parser.add_argument("--duration", type=float, default=30, help="Open-loop duration in seconds")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="Open-loop worker cap")
+    parser.add_argument("--warm", action="store_true", help="Keep memoized stage results between requests")
+    parser.add_argument("--openai-latency", default="lognormal:1.0,0.5")
+    parser.add_argument("--usda-latency", default="lognormal:0.2,0.6")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--usda-error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None,
+                        help="OpenAI requests-per-minute limit (fake server and scheduler; default unlimited)")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help="OpenAI tokens-per-minute limit (fake server and scheduler; default unlimited)")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="End-to-end deadline per analysis in seconds (from arrival)")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Earlier --json report to compare against")
+    args = parser.parse_args()
+
+    fake_openai = FakeOpenAIServer(args.rpm, args.tpm, args.openai_latency, args.openai_error_rate).start()
+    fake_usda = FakeUSDAServer(args.usda_latency, args.usda_error_rate).start()
+
+    # config reads the environment at import time, so set it up first
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-load-test",
+        "USDA_API_KEY": "load-test",
+        "OPENAI_BASE_URL": fake_openai.base_url,
+        "USDA_SEARCH_URL": fake_usda.search_url,
+        "DISH_INDEX_ENABLED": "False",
+    })
+    # Give the scheduler the fake server's limits; a .env OPENAI_TPM would
+    # otherwise throttle a server that has none
+    os.environ["OPENAI_RPM"] = str(args.rpm or UNLIMITED)
+    os.environ["OPENAI_TPM"] = str(args.tpm or UNLIMITED)
+    import pipeline
+    from clients import get_openai_scheduler
+
+    rss_start = current_rss_mb()
+    levels = []
+
+    if args.rate:
+        summary = run_open_loop(pipeline, args.rate, args.duration, args.max_concurrency, not args.warm,
+                                args.deadline)
+        levels.append({"concurrency": args.max_concurrency, "arrival_rate": args.rate, **summary})
+    else:
+        for concurrency in (int(c) for c in args.sweep.split(",")):
+            summary = run_closed_loop(pipeline, concurrency, args.requests, not args.warm, args.deadline)
+            levels.append({"concurrency": concurrency, **summary})
+
+    rss_end = current_rss_mb()
+    report = {
+        "levels": levels,
+        "saturation_concurrency": None if args.rate else find_saturation(levels),
+        "memory": {"rss_start_mb": rss_start, "rss_end_mb": rss_end, "growth_mb": rss_end - rss_start},
+        "fake_openai": dict(fake_openai.counts),
+        "fake_usda": dict(fake_usda.counts),
+        "openai_budget": {"rpm": args.rpm, "tpm": args.tpm},  # None: unlimited
+        "openai_scheduler": get_openai_scheduler().metrics(),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    fake_openai.stop()
+    fake_usda.stop()
+
+
+if __name__ == "__main__":
+    main()
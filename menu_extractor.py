@@ -1,11 +1,12 @@
 import base64
 import json
 from typing import Any, Dict, List, Union, cast
-import openai
 from openai.types.chat import ChatCompletionUserMessageParam
-from config import OPENAI_API_KEY, DEBUG_MODE
+from clients import create_chat_completion
+from config import DEBUG_MODE, MAX_DISHES, VISION_MODELS, CASCADE_MIN_VALID_RATIO
+from model_cascade import run_cascade
 
-openai.api_key = OPENAI_API_KEY
+VALID_CATEGORIES = {"appetizer", "main", "side", "dessert", "beverage", "other"}
 
 
 def encode_image_to_base64(image_file: Any) -> str:
@@ -17,6 +18,9 @@ def extract_menu_from_image(image_file: Union[str, Any]) -> List[Dict[str, Any]]
     """
     Extract dish names and descriptions from menu photo using GPT-4 Vision
 
+    Runs the VISION_MODELS cascade: the cheapest model is tried first and
+    the next one only if check_extraction_confidence rejects the output.
+
     Args:
         image_file: Uploaded image file (Streamlit UploadedFile or file path)
 
@@ -81,25 +85,38 @@ Return ONLY valid JSON array with no markdown, no preamble:
             }
         ]))
 
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.2
+        def call_model(model: str) -> Any:
+            nonlocal content
+            response = create_chat_completion(
+                model=model,
+                messages=messages,
+                max_tokens=2000,
+                temperature=0.2
+            )
+
+            content = response.choices[0].message.content.strip()
+
+            if DEBUG_MODE:
+                print(f"Raw Vision Response ({model}):\\n{content}")
+
+            # Clean up response (remove markdown if present)
+            if content.startswith('```'):
+                content = content.split('```')[1]
+                if content.startswith('json'):
+                    content = content[4:]
+
+            return json.loads(content.strip())
+
+        dishes, _, low_confidence = run_cascade(
+            "vision",
+            VISION_MODELS,
+            call_model,
+            check_extraction_confidence,
+            usable=lambda result: isinstance(result, list) and bool(result)
         )
 
-        content = response.choices[0].message.content.strip()
-
-        if DEBUG_MODE:
-            print(f"Raw Vision Response:\\n{content}")
-
-        # Clean up response (remove markdown if present)
-        if content.startswith('```'):
-            content = content.split('```')[1]
-            if content.startswith('json'):
-                content = content[4:]
-
-        dishes = json.loads(content.strip())
+        if low_confidence and len(dishes) > MAX_DISHES:
+            dishes = dishes[:MAX_DISHES]
 
         if DEBUG_MODE:
             print(f"Extracted {len(dishes)} dishes")
@@ -120,12 +137,39 @@ def validate_extracted_dishes(dishes: List[Dict[str, Any]]) -> List[Dict[str, An
     validated: List[Dict[str, Any]] = []
 
     for dish in dishes:
-        if 'name' in dish and dish['name']:
+        if isinstance(dish, dict) and isinstance(dish.get('name'), str) and dish['name'].strip():
             validated.append({
                 'name': dish['name'].strip(),
-                'description': dish.get('description', 'No description').strip(),
+                'description': str(dish.get('description') or 'No description').strip(),
                 'price': dish.get('price', 'N/A'),
-                'category': dish.get('category', 'other').lower()
+                'category': str(dish.get('category') or 'other').lower()
             })
 
-    return validated
\ No newline at end of file
+    return validated
+
+
+def check_extraction_confidence(dishes: Any) -> Union[str, None]:
+    """
+    Decide whether a vision model's output is good enough to keep
+
+    Returns:
+        None if acceptable, otherwise the reason to escalate
+    """
+    if not isinstance(dishes, list):
+        return "response is not a JSON array"
+    if not dishes:
+        return "no dishes found"
+    if len(dishes) > MAX_DISHES:
+        return f"{len(dishes)} dishes exceeds MAX_DISHES"
+
+    valid = [
+        d for d in dishes
+        if isinstance(d, dict)
+        and isinstance(d.get('name'), str) and d['name'].strip()
+        and str(d.get('category', 'other')).lower() in VALID_CATEGORIES
+    ]
+    ratio = len(valid) / len(dishes)
+    if ratio < CASCADE_MIN_VALID_RATIO:
+        return f"only {ratio:.0%} of dishes match the schema"
+
+    return None
@@ -0,0 +1,209 @@
+import contextlib
+import functools
+import json
+import os
+import re
+import sqlite3
+import time
+from config import MENU_STORE_PATH, MENU_STORE_KEEP_VERSIONS, DEBUG_MODE
+import pipeline
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS menu_versions (
+    restaurant TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    image_digest TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (restaurant, version)
+);
+CREATE TABLE IF NOT EXISTS menu_dishes (
+    restaurant TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    dish_key TEXT NOT NULL,
+    record TEXT NOT NULL,
+    has_nutrition INTEGER NOT NULL,
+    PRIMARY KEY (restaurant, version, position)
+);
+"""
+
+
+def _normalize(text):
+    return " ".join(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+
+def dish_key(dish):
+    """Identity of a dish across menu versions (its normalized name)"""
+    return _normalize(dish['name'])
+
+
+class MenuStore:
+    """
+    Persistent per-restaurant menus with dish-level diffs between versions
+
+    Each ingested version stores the validated dishes merged with their
+    nutrition. A new version is compared to the latest one by dish name:
+
+    - added: name not on the previous menu → nutrition fetched
+    - changed: same name, different description → nutrition fetched
+    - unchanged: same name and description → nutrition reused (price and
+      category are taken from the new menu)
+    - removed: only on the previous menu
+
+    so a refresh costs lookups proportional to what changed. Unchanged
+    dishes that had no nutrition last time are retried.
+    """
+
+    def __init__(self, db_path, keep_versions=5):
+        self.db_path = db_path
+        self.keep_versions = keep_versions
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def latest(self, restaurant):
+        """
+        Returns:
+            dict: {version, image_digest, records, dishes_with_nutrition} or None if unknown,
+            where records lists (record, has_nutrition) for every dish in menu order
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT version, image_digest FROM menu_versions WHERE restaurant=? "
+                "ORDER BY version DESC LIMIT 1",
+                (restaurant,)
+            ).fetchone()
+            if row is None:
+                return None
+            version, digest = row
+            records = conn.execute(
+                "SELECT record, has_nutrition FROM menu_dishes WHERE restaurant=? AND version=? ORDER BY position",
+                (restaurant, version)
+            ).fetchall()
+
+        return {
+            "version": version,
+            "image_digest": digest,
+            "records": [(json.loads(record), bool(has_nutrition)) for record, has_nutrition in records],
+            "dishes_with_nutrition": [json.loads(record) for record, has_nutrition in records if has_nutrition]
+        }
+
+    def ingest(self, restaurant, dishes, image_digest=None, on_progress=None):
+        """
+        Store a new menu version, fetching nutrition only for what changed
+
+        Args:
+            restaurant: Restaurant identifier
+            dishes: Output of validate_extracted_dishes
+            image_digest: Digest of the source image, if any
+            on_progress: Optional fn(done, total) for the nutrition lookups
+
+        Returns:
+            dict: {version, dishes_with_nutrition, diff: {added, changed, removed, unchanged},
+            fetched, skipped} where skipped names the dishes the deadline left without nutrition
+
+        A version with skipped dishes doesn't keep the image digest, so the
+        same photo is ingested again (looking up just those dishes) next time.
+        """
+        # No lock around the lookups: concurrent ingests only serialize on the INSERT below
+        previous = self.latest(restaurant)
+        previous_by_key = {}
+        for record, has_nutrition in (previous["records"] if previous else []):
+            previous_by_key.setdefault(dish_key(record), (record, has_nutrition))
+
+        diff = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        entries = []  # (key, dish, reused record or None)
+        seen = set()
+
+        for dish in dishes:
+            key = dish_key(dish)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+
+            old = previous_by_key.get(key)
+            if old is None:
+                diff["added"].append(dish['name'])
+                entries.append((key, dish, None))
+            elif _normalize(old[0].get('description')) != _normalize(dish.get('description')):
+                diff["changed"].append(dish['name'])
+                entries.append((key, dish, None))
+            else:
+                diff["unchanged"].append(dish['name'])
+                # Keep the stored nutrition, take name/price/category from the new menu
+                entries.append((key, dish, {**old[0], **dish} if old[1] else None))
+
+        diff["removed"] = [
+            record['name'] for key, (record, _) in previous_by_key.items() if key not in seen
+        ]
+
+        to_fetch = [dish for _, dish, reused in entries if reused is None]
+        skipped = []
+        fetched = {
+            dish_key(record): record
+            for record in pipeline.fetch_nutrition(
+                to_fetch, on_progress=on_progress, on_skipped=lambda dish: skipped.append(dish['name'])
+            )
+        } if to_fetch else {}
+
+        records = []
+        for key, dish, reused in entries:
+            record = reused or fetched.get(key)
+            records.append((key, json.dumps(record or dish), int(record is not None)))
+
+        with self._connect() as conn:
+            # Re-read the version inside a write transaction: another ingest
+            # for this restaurant may have landed while we were fetching
+            conn.execute("BEGIN IMMEDIATE")
+            latest_version = conn.execute(
+                "SELECT MAX(version) FROM menu_versions WHERE restaurant=?", (restaurant,)
+            ).fetchone()[0] or 0
+            version = latest_version + 1
+            if DEBUG_MODE and latest_version != (previous["version"] if previous else 0):
+                print(f"Menu {restaurant}: v{latest_version} was stored concurrently, storing as v{version}")
+
+            conn.execute(
+                "INSERT INTO menu_versions (restaurant, version, image_digest, created_at) VALUES (?, ?, ?, ?)",
+                (restaurant, version, None if skipped else image_digest, time.time())
+            )
+            conn.executemany(
+                "INSERT INTO menu_dishes VALUES (?, ?, ?, ?, ?, ?)",
+                [(restaurant, version, position, *record) for position, record in enumerate(records)]
+            )
+            conn.execute(
+                "DELETE FROM menu_dishes WHERE restaurant=? AND version <= ?",
+                (restaurant, version - self.keep_versions)
+            )
+            conn.execute(
+                "DELETE FROM menu_versions WHERE restaurant=? AND version <= ?",
+                (restaurant, version - self.keep_versions)
+            )
+
+        if DEBUG_MODE:
+            print(f"Menu {restaurant} v{version}: " + ", ".join(f"{len(v)} {k}" for k, v in diff.items()))
+
+        return {
+            "version": version,
+            "dishes_with_nutrition": [json.loads(record) for _, record, has_nutrition in records if has_nutrition],
+            "diff": diff,
+            "fetched": len(to_fetch),
+            "skipped": skipped
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def get_menu_store():
+    """Process-wide menu store"""
+    return MenuStore(MENU_STORE_PATH, keep_versions=MENU_STORE_KEEP_VERSIONS)
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import deque
+from config import DEBUG_MODE
+from deadline import deadline_expired
+from helper import percentile
+
+
+class CascadeMetrics:
+    """Thread-safe per-tier latency and escalation counters"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._window = window
+        self._latencies = {}   # (stage, model) -> deque of seconds
+        self._calls = {}       # (stage, model) -> int
+        self._escalations = {}  # (stage, model) -> int
+        self._low_confidence = {}  # (stage, model) -> int, results kept although they failed the check
+
+    def record(self, stage, model, latency, escalated):
+        key = (stage, model)
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self._window)).append(latency)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            if escalated:
+                self._escalations[key] = self._escalations.get(key, 0) + 1
+
+    def record_low_confidence(self, stage, model):
+        key = (stage, model)
+        with self._lock:
+            self._low_confidence[key] = self._low_confidence.get(key, 0) + 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {stage: {model: {calls, escalations, escalation_rate, low_confidence, p50_ms, p95_ms}}}
+        """
+        with self._lock:
+            result = {}
+            for (stage, model), calls in self._calls.items():
+                latencies = sorted(self._latencies[(stage, model)])
+                escalations = self._escalations.get((stage, model), 0)
+                result.setdefault(stage, {})[model] = {
+                    "calls": calls,
+                    "escalations": escalations,
+                    "escalation_rate": round(escalations / calls, 3),
+                    "low_confidence": self._low_confidence.get((stage, model), 0),
+                    "p50_ms": round(percentile(latencies, 50) * 1000),
+                    "p95_ms": round(percentile(latencies, 95) * 1000),
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._latencies.clear()
+            self._calls.clear()
+            self._escalations.clear()
+            self._low_confidence.clear()
+
+
+_metrics = CascadeMetrics()
+
+# What a bad answer raises (json.JSONDecodeError is a ValueError, missing or
+# mistyped fields raise the others). Anything else - rate limits, connection
+# errors, scheduler or deadline timeouts - says nothing about the model's
+# answer, and a bigger model would only queue behind the same limits.
+LOW_CONFIDENCE_ERRORS = (ValueError, KeyError, TypeError, AttributeError, IndexError)
+
+
+def get_cascade_metrics():
+    """Current per-tier metrics for all cascaded stages"""
+    return _metrics.snapshot()
+
+
+def run_cascade(stage, models, call_model, check_result, usable=None):
+    """
+    Try models from cheapest to largest, escalating on low confidence
+
+    Args:
+        stage: Metrics label ("vision", "analysis")
+        models: Ordered list of model names, cheapest first
+        call_model: fn(model) -> parsed result; may raise (see LOW_CONFIDENCE_ERRORS)
+        check_result: fn(result) -> None if acceptable, else a reason string
+        usable: fn(result) -> bool, whether a result that failed check_result
+            is still safe to return (default: any parsed result)
+
+    Only parse/validation failures escalate; other errors from call_model
+    stop the cascade. Does not escalate once the request deadline has
+    passed. If no tier passes, the last usable result is returned, flagged
+    low confidence.
+
+    Returns:
+        tuple: (result, model, reason) where reason is None if the result
+        passed validation, else why it is low confidence
+
+    Raises:
+        The error that stopped the cascade (or ValueError) if no tier produced a usable result
+    """
+    last_error = None
+    fallback = None  # (result, model, reason) of the latest usable low-confidence result
+
+    for i, model in enumerate(models):
+        is_last = i == len(models) - 1
+        start = time.perf_counter()
+        try:
+            result = call_model(model)
+        except LOW_CONFIDENCE_ERRORS as e:
+            result = None
+            reason = f"{type(e).__name__}: {e}"
+            last_error = e
+        except Exception as e:
+            _metrics.record(stage, model, time.perf_counter() - start, False)
+            if fallback is None:
+                raise
+            if DEBUG_MODE:
+                print(f"⚠ {stage}: {model} failed ({type(e).__name__}: {e}), not escalating")
+            break
+        else:
+            try:
+                reason = check_result(result)
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+            if reason is not None and (usable is None or usable(result)):
+                fallback = (result, model, reason)
+
+        latency = time.perf_counter() - start
+        escalate = reason is not None and not is_last and not deadline_expired()
+        _metrics.record(stage, model, latency, escalate)
+
+        if reason is None:
+            if DEBUG_MODE:
+                print(f"✓ {stage}: {model} accepted ({latency:.2f}s)")
+            return result, model, None
+
+        if DEBUG_MODE:
+            print(f"⚠ {stage}: {model} low confidence ({reason})" + (", escalating" if escalate else ""))
+        if not escalate:
+            break
+
+    if fallback is not None:
+        result, model, reason = fallback
+        _metrics.record_low_confidence(stage, model)
+        if DEBUG_MODE:
+            print(f"⚠ {stage}: keeping {model}'s low-confidence result ({reason})")
+        return fallback
+
+    if last_error is not None and result is None:
+        raise last_error
+    raise ValueError(f"{stage} cascade exhausted: {reason}")
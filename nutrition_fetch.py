@@ -1,16 +1,130 @@
-import requests
+import functools
+import threading
 import time
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from clients import get_http_session
 from config import (
     USDA_API_KEY,
     USDA_SEARCH_URL,
+    USDA_TIMEOUT,
+    USDA_HEDGE_ENABLED,
+    USDA_HEDGE_PERCENTILE,
+    USDA_HEDGE_DEFAULT_DELAY,
+    USDA_HEDGE_MIN_SAMPLES,
+    USDA_HEDGE_MAX_RATIO,
+    JOB_WORKERS,
+    NUTRITION_MAX_WORKERS,
+    USDA_BREAKER_FAILURES,
+    USDA_BREAKER_RESET_SECONDS,
+    USDA_CACHE_SIZE,
+    DISH_INDEX_ENABLED,
+    DISH_INDEX_DIR,
+    DISH_INDEX_DIM,
+    DISH_INDEX_THRESHOLD,
     DEBUG_MODE
 )
+from dish_index import DishIndex
+from resilience import CircuitBreaker, HedgePolicy, hedged_call
+from deadline import DeadlineExceeded, budget_timeout, deadline_expired
+from profiling import attach_thread
+
+
+_usda_breaker = CircuitBreaker(
+    "usda",
+    failure_threshold=USDA_BREAKER_FAILURES,
+    reset_timeout=USDA_BREAKER_RESET_SECONDS
+)
+_usda_hedge = HedgePolicy(
+    percentile=USDA_HEDGE_PERCENTILE,
+    default_delay=USDA_HEDGE_DEFAULT_DELAY,
+    min_samples=USDA_HEDGE_MIN_SAMPLES,
+    max_ratio=USDA_HEDGE_MAX_RATIO
+)
+# Every job can have NUTRITION_MAX_WORKERS lookups in flight, each with a possible hedge
+_usda_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS * NUTRITION_MAX_WORKERS * 2, thread_name_prefix="hedge")
+
+# Last good USDA answers, served when the circuit is open or a call fails
+_usda_cache = OrderedDict()
+_usda_cache_lock = threading.Lock()
+
+
+def _cache_key(dish_name):
+    return " ".join(dish_name.lower().split())
+
+
+def _get_cached_nutrition(dish_name):
+    with _usda_cache_lock:
+        result = _usda_cache.get(_cache_key(dish_name))
+        if result is not None:
+            _usda_cache.move_to_end(_cache_key(dish_name))
+        return result
+
+
+def _cache_nutrition(dish_name, result):
+    with _usda_cache_lock:
+        _usda_cache[_cache_key(dish_name)] = result
+        _usda_cache.move_to_end(_cache_key(dish_name))
+        while len(_usda_cache) > USDA_CACHE_SIZE:
+            _usda_cache.popitem(last=False)
+
+
+def _search_usda(dish_name, timeout=USDA_TIMEOUT):
+    """
+    Single USDA search request
+
+    Returns:
+        dict: Nutrition data, or None if USDA has no match
+
+    Raises:
+        requests.RequestException on timeouts and non-200 responses
+    """
+    params = {
+        "query": dish_name,
+        "dataType": ["Survey (FNDDS)", "Branded"],
+        "pageSize": 1,
+        "api_key": USDA_API_KEY
+    }
+
+    response = get_http_session().get(USDA_SEARCH_URL, params=params, timeout=timeout)
+    response.raise_for_status()
+
+    foods = response.json().get('foods', [])
+    if not foods:
+        return None
+
+    food = foods[0]
+    nutrients = {
+        n['nutrientName']: n['value']
+        for n in food.get('foodNutrients', [])
+    }
+
+    return {
+        "dish": dish_name,
+        "calories": round(nutrients.get('Energy', 0)),
+        "protein": round(nutrients.get('Protein', 0), 1),
+        "carbs": round(nutrients.get('Carbohydrate, by difference', 0), 1),
+        "fat": round(nutrients.get('Total lipid (fat)', 0), 1),
+        "fiber": round(nutrients.get('Fiber, total dietary', 0), 1),
+        "sugar": round(nutrients.get('Sugars, total including NLEA', 0), 1),
+        "sodium": round(nutrients.get('Sodium, Na', 0)),
+        "serving_size": 100,
+        "serving_unit": "g",
+        "source": "usda"
+    }
 
 
 def get_nutrition_usda(dish_name):
     """
     Fetch nutrition data from USDA FoodData Central (Fallback)
 
+    Slow lookups are hedged with a duplicate request after the p95 latency.
+    Repeated failures open a circuit breaker; while it is open USDA is not
+    called and the last cached answer (if any) is returned immediately.
+    The same happens once the request deadline has passed, and the timeout
+    is shortened to what is left of it.
+
     Args:
         dish_name: Name of the dish
 
@@ -22,63 +136,118 @@ def get_nutrition_usda(dish_name):
             print("USDA API key not configured, skipping...")
         return None
 
-    try:
-        params = {
-            "query": dish_name,
-            "dataType": ["Survey (FNDDS)", "Branded"],
-            "pageSize": 1,
-            "api_key": USDA_API_KEY
-        }
-
-        response = requests.get(USDA_SEARCH_URL, params=params, timeout=10)
-
-        if response.status_code == 200:
-            data = response.json()
-            foods = data.get('foods', [])
-
-            if foods:
-                food = foods[0]
-                nutrients = {
-                    n['nutrientName']: n['value']
-                    for n in food.get('foodNutrients', [])
-                }
-
-                result = {
-                    "dish": dish_name,
-                    "calories": round(nutrients.get('Energy', 0)),
-                    "protein": round(nutrients.get('Protein', 0), 1),
-                    "carbs": round(nutrients.get('Carbohydrate, by difference', 0), 1),
-                    "fat": round(nutrients.get('Total lipid (fat)', 0), 1),
-                    "fiber": round(nutrients.get('Fiber, total dietary', 0), 1),
-                    "sugar": round(nutrients.get('Sugars, total including NLEA', 0), 1),
-                    "sodium": round(nutrients.get('Sodium, Na', 0)),
-                    "serving_size": 100,
-                    "serving_unit": "g",
-                    "source": "usda"
-                }
-
-                if DEBUG_MODE:
-                    print(f"✓ USDA: {dish_name} - {result['calories']} cal")
-
-                return result
+    # Before allow(): a skipped call must not take the half-open trial slot
+    if deadline_expired():
+        if DEBUG_MODE:
+            print(f"⏱ Out of time, skipping USDA lookup for {dish_name}")
+        return _get_cached_nutrition(dish_name)
 
-        return None
+    if not _usda_breaker.allow():
+        if DEBUG_MODE:
+            print(f"⚡ USDA circuit open, skipping lookup for {dish_name}")
+        return _get_cached_nutrition(dish_name)
+
+    def attempt():
+        # Sized when the attempt starts: it may have queued for a worker
+        timeout = budget_timeout(USDA_TIMEOUT)
+        if timeout <= 0:
+            raise DeadlineExceeded("USDA lookup started after the deadline")
+        try:
+            return _search_usda(dish_name, timeout)
+        except requests.Timeout as e:
+            if timeout < USDA_TIMEOUT:
+                raise DeadlineExceeded(f"USDA lookup cut short by the deadline ({timeout:.1f}s)") from e
+            raise
 
+    try:
+        result = hedged_call(attach_thread(attempt), _usda_hedge, _usda_executor, enabled=USDA_HEDGE_ENABLED)
+    except DeadlineExceeded as e:
+        # Cut short by our own budget: says nothing about USDA's health
+        _usda_breaker.release()
+        if DEBUG_MODE:
+            print(f"⏱ USDA lookup for {dish_name} skipped: {e}")
+        return _get_cached_nutrition(dish_name)
     except Exception as e:
+        _usda_breaker.record_failure()
         print(f"USDA error for {dish_name}: {e}")
+        return _get_cached_nutrition(dish_name)
+
+    _usda_breaker.record_success()
+
+    if result:
+        _cache_nutrition(dish_name, result)
+        if DEBUG_MODE:
+            print(f"✓ USDA: {dish_name} - {result['calories']} cal")
+
+    return result
+
+
+def estimate_usda_seconds():
+    """Pessimistic (hedge percentile) duration of one USDA lookup"""
+    return _usda_hedge.delay()
+
+
+def get_usda_metrics():
+    """Circuit breaker and hedging counters for the USDA client"""
+    return {
+        "breaker": _usda_breaker.metrics(),
+        "hedging": _usda_hedge.metrics(),
+        "cached_dishes": len(_usda_cache)
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def get_dish_index():
+    """Process-wide near-duplicate dish index, or None if disabled"""
+    if not DISH_INDEX_ENABLED:
         return None
+    return DishIndex(DISH_INDEX_DIR, dim=DISH_INDEX_DIM)
+
+
+def get_nutrition_from_index(dish_name):
+    """
+    Reuse nutrition of a previously resolved, near-identical dish
+
+    Returns:
+        dict: Nutrition data (source "index") or None if nothing is similar enough
+    """
+    index = get_dish_index()
+    if index is None:
+        return None
+
+    entry, similarity = index.search(dish_name)
+    if entry is None or similarity < DISH_INDEX_THRESHOLD:
+        return None
+
+    if DEBUG_MODE:
+        print(f"✓ Index: {dish_name} ≈ {entry['name']} ({similarity:.2f})")
+
+    return {
+        **entry['nutrition'],
+        "dish": dish_name,
+        "source": "index",
+        "matched_dish": entry['name'],
+        "similarity": round(similarity, 3)
+    }
 
 
 def get_nutrition_with_fallback(dish_name, description=""):
     """
     Try multiple nutrition sources with fallback
 
-    Priority: Nutritionix → USDA → GPT Estimation
+    Priority: Dish index → USDA → GPT Estimation
     """
 
-    # Try USDA first
+    # Near-duplicates of dishes we resolved before cost no API call
+    result = get_nutrition_from_index(dish_name)
+    if result:
+        return result
+
     result = get_nutrition_usda(dish_name)
     if result:
+        index = get_dish_index()
+        if index is not None:
+            index.add(dish_name, result)
         return result
 
     # Last resort: GPT estimation (implement if needed)
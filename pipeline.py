@@ -0,0 +1,197 @@
+import contextvars
+import hashlib
+import io
+import json
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from menu_extractor import extract_menu_from_image, validate_extracted_dishes
+from nutrition_fetch import get_nutrition_with_fallback, estimate_usda_seconds
+from agent_analyzer import analyze_menu_with_preferences, get_fallback_analysis
+from profiling import attach_thread
+from deadline import DeadlineExceeded, use_deadline, deadline_expired, time_remaining
+from config import (
+    STREAM_ANALYSIS,
+    NUTRITION_BUDGET_SECONDS,
+    ANALYSIS_BUDGET_SECONDS,
+    ANALYSIS_MIN_SECONDS,
+    NUTRITION_MAX_WORKERS,
+    DEBUG_MODE
+)
+
+
+class _LRUCache:
+    """Small thread-safe LRU used to memoize stage results per process"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+# Extraction and nutrition only depend on the image, so they are memoized
+# across reruns, sessions and jobs. Only successful results are stored.
+_extraction_cache = _LRUCache(64)
+_nutrition_cache = _LRUCache(4096)
+_analysis_cache = _LRUCache(256)
+
+
+def clear_caches():
+    """Forget all memoized stage results (e.g. for cold-start load tests)"""
+    _extraction_cache.clear()
+    _nutrition_cache.clear()
+    _analysis_cache.clear()
+
+
+def image_digest(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def analysis_key(dishes_with_nutrition, user_prefs):
+    """Stable key for one menu + profile combination"""
+    payload = json.dumps([dishes_with_nutrition, user_prefs], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def extract_dishes(image_bytes):
+    """
+    Vision extraction + validation, memoized per image content
+
+    Under a deadline, the nutrition and analysis budgets are kept back.
+
+    Raises:
+        ValueError: if no dishes could be extracted
+        DeadlineExceeded: if extraction ran out of time
+    """
+    digest = image_digest(image_bytes)
+    dishes = _extraction_cache.get(digest)
+    if dishes is None:
+        with use_deadline(reserve=NUTRITION_BUDGET_SECONDS + ANALYSIS_BUDGET_SECONDS):
+            dishes = validate_extracted_dishes(extract_menu_from_image(io.BytesIO(image_bytes)))
+            out_of_time = deadline_expired()
+        if not dishes:
+            if out_of_time:
+                raise DeadlineExceeded("Ran out of time reading the menu")
+            raise ValueError("No dishes extracted")
+        _extraction_cache.put(digest, dishes)
+    return dishes
+
+
+def _lookup_nutrition(dish, on_skipped=None):
+    key = (dish['name'], dish.get('description', ''))
+    nutrition = _nutrition_cache.get(key)
+    if nutrition is None:
+        nutrition = get_nutrition_with_fallback(dish['name'], dish.get('description', ''))
+        if nutrition:
+            _nutrition_cache.put(key, nutrition)
+        elif on_skipped and deadline_expired():
+            on_skipped(dish)
+    return nutrition
+
+
+def _lookup_workers(pending):
+    """Just enough parallel lookups to finish within the time left"""
+    remaining = time_remaining()
+    if remaining is None or pending <= 1:
+        return 1
+    needed = pending * estimate_usda_seconds()
+    return max(1, min(NUTRITION_MAX_WORKERS, pending, math.ceil(needed / max(remaining, 0.001))))
+
+
+def fetch_nutrition(dishes, on_progress=None, on_skipped=None):
+    """
+    Nutrition for each dish, memoized per dish
+
+    Under a deadline, the analysis budget is kept back and lookups run in
+    parallel when they would not fit sequentially. Dishes whose lookup
+    would start after the deadline only get cached or indexed data.
+
+    Args:
+        dishes: Validated dishes from extract_dishes
+        on_progress: Optional fn(done, total) called after each dish
+        on_skipped: Optional fn(dish) for each dish left without nutrition
+            because the deadline ran out (may be called from worker threads)
+
+    Returns:
+        list: Dish info merged with nutrition, for dishes that were found
+    """
+    results = [None] * len(dishes)
+
+    with use_deadline(reserve=ANALYSIS_BUDGET_SECONDS):
+        pending = sum(1 for d in dishes if _nutrition_cache.get((d['name'], d.get('description', ''))) is None)
+        workers = _lookup_workers(pending)
+
+        if workers == 1:
+            for i, dish in enumerate(dishes):
+                results[i] = _lookup_nutrition(dish, on_skipped)
+                if on_progress:
+                    on_progress(i + 1, len(dishes))
+        else:
+            if DEBUG_MODE:
+                print(f"⏱ {pending} lookups in {time_remaining():.1f}s: {workers} in parallel")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nutrition") as executor:
+                # Each lookup runs in a copy of this context, so it sees the deadline
+                futures = {
+                    executor.submit(
+                        contextvars.copy_context().run, attach_thread(_lookup_nutrition), dish, on_skipped
+                    ): i
+                    for i, dish in enumerate(dishes)
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    results[futures[future]] = future.result()
+                    if on_progress:
+                        on_progress(done, len(dishes))
+
+    # Keep dish info (description, price) next to the nutrition
+    return [{**dish, **nutrition} for dish, nutrition in zip(dishes, results) if nutrition]
+
+
+def analyze(dishes_with_nutrition, user_prefs, on_item=None):
+    """
+    LLM analysis, memoized per menu and profile
+
+    With STREAM_ANALYSIS, on_item(section, item) is called for every
+    recommendation of the first ANALYSIS_MODELS tier as soon as it has been
+    generated, and with ("reset", None) if that answer is then rejected and
+    escalated (see analyze_menu_with_preferences). With less than
+    ANALYSIS_MIN_SECONDS left of the deadline, the rule-based fallback is
+    returned without calling the LLM.
+    """
+    key = analysis_key(dishes_with_nutrition, user_prefs)
+    analysis = _analysis_cache.get(key)
+    if analysis is not None:
+        return analysis
+
+    remaining = time_remaining()
+    if remaining is not None and remaining < ANALYSIS_MIN_SECONDS:
+        if DEBUG_MODE:
+            print(f"⏱ {remaining:.1f}s left, using the rule-based analysis")
+        return get_fallback_analysis(dishes_with_nutrition, user_prefs)
+
+    analysis = analyze_menu_with_preferences(
+        dishes_with_nutrition, user_prefs, on_item=on_item if STREAM_ANALYSIS else None
+    )
+
+    # Don't pin the rule-based fallback; the next request retries the LLM
+    if analysis.get("source") != "fallback":
+        _analysis_cache.put(key, analysis)
+    return analysis
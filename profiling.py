@@ -0,0 +1,243 @@
+"""
+Built-in profiling for single pipeline runs, without external tools
+
+Enable for every analysis job with PROFILE_MODE=True, or per request (the
+"Profile runs" toggle in debug mode, JobQueue.submit(profile=True)); the
+results rendering is only profiled on demand ("Profile results rendering").
+Each profiled run writes to PROFILE_DIR:
+
+- <run>.collapsed: sampled stacks in the collapsed format read by
+  flamegraph.pl, speedscope and inferno ("thread;frame;frame count")
+- <run>.alloc.txt: tracemalloc report of the allocations live at the
+  run's memory peak and those still retained at its end
+
+Samples are wall-clock stacks of the thread that started the run plus the
+helper threads working for it (nutrition lookups, USDA hedges), which join
+through attach_thread(); other sessions' threads are not sampled. Base64
+encoding, JSON parsing, prompt building, the nutrition loop and Streamlit
+rendering all show up under their own function names.
+
+tracemalloc cannot attribute memory to threads, so the allocation report
+is process-wide: it includes whatever ran concurrently with the run.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from config import PROFILE_MODE, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_TOP_ALLOCATIONS, DEBUG_MODE
+
+TRACEBACK_FRAMES = 10
+
+# Innermost frames of a thread with nothing to do
+IDLE_FRAMES = {
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("base_events.py", "_run_once"),
+    ("socketserver.py", "serve_forever"),
+}
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+# Profiler of the run the current code works for, if any
+_active_profiler = contextvars.ContextVar("active_profiler", default=None)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _thread_label(name):
+    # Pool workers "analysis-job_0", "analysis-job_1" share one flamegraph root
+    return re.sub(r"_\d+$", "", name).replace(";", ":").replace(" ", "_")
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+class RunProfiler:
+    """
+    Stack sampler + tracemalloc snapshots around one run
+
+    Args:
+        name: Label used in the output file names
+        interval: Seconds between stack samples
+        output_dir: Where the reports are written
+    """
+
+    def __init__(self, name, interval=PROFILE_SAMPLE_INTERVAL_MS / 1000, output_dir=PROFILE_DIR):
+        self.name = name
+        self.interval = interval
+        self.output_dir = output_dir
+        self.stacks = Counter()
+        self.samples = 0
+        self.paths = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._threads = Counter()  # ident -> nesting depth of the threads working for the run
+        self._threads_lock = threading.Lock()
+
+    def add_thread(self):
+        with self._threads_lock:
+            self._threads[threading.get_ident()] += 1
+
+    def remove_thread(self):
+        with self._threads_lock:
+            ident = threading.get_ident()
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def start(self):
+        _start_tracemalloc()
+        self._start_snapshot = self._snapshot()
+        self._peak_snapshot = None
+        self._peak_bytes = tracemalloc.get_traced_memory()[0]
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                run_threads = set(self._threads)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in run_threads:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(_thread_label(names.get(thread_id, str(thread_id))))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+            # Keep a snapshot near the memory peak: short-lived buffers
+            # (base64 images, response JSON) are gone by the end of the run
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self._peak_bytes * 1.1:
+                self._peak_bytes = current
+                self._peak_snapshot = self._snapshot()
+
+    def stop(self):
+        """Stop sampling and write the reports; returns their paths"""
+        self._stop.set()
+        self._thread.join()
+        duration = time.perf_counter() - self._started
+        end_snapshot = self._snapshot()
+        _stop_tracemalloc()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(
+            self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{uuid.uuid4().hex[:6]}"
+        )
+        self.paths = {"collapsed": base + ".collapsed", "allocations": base + ".alloc.txt"}
+
+        with open(self.paths["collapsed"], "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(self.paths["allocations"], "w") as f:
+            f.write(f"Run: {self.name}\nDuration: {duration:.3f}s, {self.samples} stack samples\n")
+            f.write("Allocations are process-wide: they include other sessions and jobs running at the same time\n")
+            if self._peak_snapshot is not None:
+                f.write(f"\n== Live at peak ({self._peak_bytes / 1024 ** 2:.1f} MB traced), growth since start ==\n")
+                self._write_top(f, self._peak_snapshot.compare_to(self._start_snapshot, "lineno"))
+            f.write("\n== Retained at end of run, growth since start ==\n")
+            self._write_top(f, end_snapshot.compare_to(self._start_snapshot, "lineno"))
+
+        if DEBUG_MODE:
+            print(f"Profile of {self.name} written to {base}.*")
+        return self.paths
+
+    @staticmethod
+    def _write_top(f, stats):
+        growth = [stat for stat in stats if stat.size_diff > 0][:PROFILE_TOP_ALLOCATIONS]
+        if not growth:
+            f.write("(no growth)\n")
+        for stat in growth:
+            frame = stat.traceback[0]
+            f.write(f"{stat.size_diff / 1024:>10.1f} KiB {stat.count_diff:>+8} blocks  "
+                    f"{frame.filename}:{frame.lineno}\n")
+
+
+@contextlib.contextmanager
+def profile_run(name, enabled=None):
+    """
+    Profile the enclosed block when enabled (default: PROFILE_MODE)
+
+    Yields:
+        RunProfiler or None; its .paths are set once the block exits
+    """
+    if enabled is None:
+        enabled = PROFILE_MODE
+    if not enabled:
+        yield None
+        return
+
+    profiler = RunProfiler(name)
+    profiler.add_thread()
+    token = _active_profiler.set(profiler)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        _active_profiler.reset(token)
+        profiler.remove_thread()
+        profiler.stop()
+
+
+def attach_thread(fn):
+    """
+    Wrap fn so the thread that runs it is sampled by the caller's profiler
+
+    Call it on the run's own thread when handing work to a pool; a no-op
+    outside a profiled run.
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        profiler.add_thread()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.remove_thread()
+
+    return run
@@ -0,0 +1,187 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from helper import percentile
+
+# Priorities (lower is served first)
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Rough token cost of one high-detail menu photo (tiles + base tokens)
+IMAGE_TOKEN_ESTIMATE = 1105
+
+_current_priority = contextvars.ContextVar("openai_priority", default=INTERACTIVE)
+
+
+class SchedulerTimeout(TimeoutError):
+    """Raised when a request waits longer than allowed for rate-limit budget"""
+
+
+@contextlib.contextmanager
+def use_priority(priority):
+    """Run OpenAI calls in this block at the given priority (e.g. BATCH)"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def estimate_request_tokens(messages, max_tokens=0):
+    """
+    Estimate the TPM cost of a chat request before sending it
+
+    ~4 characters per token for text, a flat cost per image, plus the
+    completion budget (OpenAI counts max_tokens against TPM up front).
+    """
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                images += 1
+            else:
+                chars += len(part.get("text", ""))
+
+    return chars // 4 + images * IMAGE_TOKEN_ESTIMATE + (max_tokens or 0)
+
+
+class OpenAIScheduler:
+    """
+    Process-wide admission control against requests/tokens per minute
+
+    Both budgets are token buckets refilled continuously. Waiting requests
+    are admitted strictly in (priority, arrival) order, so interactive
+    sessions always go ahead of queued batch jobs.
+    """
+
+    def __init__(self, rpm, tpm, window=1000):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+
+        self._admitted = {p: 0 for p in PRIORITY_NAMES}
+        self._timeouts = {p: 0 for p in PRIORITY_NAMES}
+        self._waits = {p: deque(maxlen=window) for p in PRIORITY_NAMES}
+        self._rate_limited = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _time_until_available(self, tokens):
+        request_wait = max(0.0, 1 - self._requests) * 60 / self.rpm
+        token_wait = max(0.0, tokens - self._tokens) * 60 / self.tpm
+        return max(request_wait, token_wait, 0.001)
+
+    def acquire(self, tokens, priority=None, timeout=None):
+        """
+        Block until the request fits the RPM/TPM budget
+
+        Args:
+            tokens: Estimated token cost (see estimate_request_tokens)
+            priority: INTERACTIVE or BATCH (defaults to the use_priority context)
+            timeout: Max seconds to wait, None to wait indefinitely
+
+        Returns:
+            int: Tokens reserved; pass to settle() once the call finishes
+        """
+        if priority is None:
+            priority = _current_priority.get()
+        # A request larger than the whole budget would never be admitted
+        tokens = min(tokens, self.tpm)
+
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            start = time.monotonic()
+            deadline = None if timeout is None else start + timeout
+
+            try:
+                while True:
+                    self._refill()
+                    is_head = self._waiting[0] == entry
+                    if is_head and self._requests >= 1 and self._tokens >= tokens:
+                        heapq.heappop(self._waiting)
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        self._admitted[priority] += 1
+                        self._waits[priority].append(time.monotonic() - start)
+                        return tokens
+
+                    wait = self._time_until_available(tokens) if is_head else 1.0
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts[priority] += 1
+                            raise SchedulerTimeout(
+                                f"Waited {timeout}s for OpenAI rate-limit budget"
+                            )
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def settle(self, reserved, actual):
+        """Correct the token bucket with the actual usage reported by the API"""
+        with self._cond:
+            self._refill()
+            self._tokens = min(self.tpm, self._tokens + reserved - actual)
+            self._cond.notify_all()
+
+    def record_rate_limited(self):
+        """
+        Note a 429 from the API
+
+        Empties the request bucket so every waiter pauses instead of
+        piling more requests onto an already limited key.
+        """
+        with self._cond:
+            self._rate_limited += 1
+            self._refill()
+            self._requests = min(self._requests, 0.0)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: queue depth, admitted count, timeouts and wait p50/p95 per priority,
+            plus 429 count and current remaining budget
+        """
+        with self._cond:
+            self._refill()
+            queued = [p for p, _ in self._waiting]
+            result = {
+                "rate_limited": self._rate_limited,
+                "available_requests": round(self._requests, 1),
+                "available_tokens": round(self._tokens),
+            }
+            for priority, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[priority])
+                result[name] = {
+                    "queue_depth": queued.count(priority),
+                    "admitted": self._admitted[priority],
+                    "timeouts": self._timeouts[priority],
+                    "wait_p50_ms": round(percentile(waits, 50) * 1000),
+                    "wait_p95_ms": round(percentile(waits, 95) * 1000),
+                }
+            return result
@@ -0,0 +1,218 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from helper import percentile
+from deadline import DeadlineExceeded, time_remaining
+
+
+class CircuitBreaker:
+    """
+    Classic closed → open → half-open breaker
+
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through: success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.counters = {"calls": 0, "successes": 0, "failures": 0, "short_circuited": 0, "opened": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = "half_open"
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self):
+        """True if a call may go through now (counts as a short-circuit otherwise)"""
+        with self._lock:
+            state = self._current_state()
+            if state == "closed" or (state == "half_open" and not self._trial_in_flight):
+                self._trial_in_flight = state == "half_open"
+                self.counters["calls"] += 1
+                return True
+            self.counters["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.counters["successes"] += 1
+            self._consecutive_failures = 0
+            self._state = "closed"
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give back an allowed call that ended without a verdict (e.g. cut short by our own deadline)"""
+        with self._lock:
+            if self._state == "half_open":
+                self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.counters["failures"] += 1
+            self._consecutive_failures += 1
+            if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                if self._state != "open":
+                    self.counters["opened"] += 1
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def metrics(self):
+        with self._lock:
+            return {"state": self._current_state(), **self.counters}
+
+
+class HedgePolicy:
+    """
+    Tracks call latency and decides when to send a duplicate request
+
+    The hedge delay is the chosen latency percentile of recent successful
+    calls, or `default_delay` until `min_samples` calls have been seen.
+    Outstanding hedges are capped at `max_ratio` of the calls in flight
+    (at least one), so a slow backend doesn't get its load doubled.
+    """
+
+    def __init__(self, percentile=95, default_delay=1.0, min_samples=20, window=500, max_ratio=0.1):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._in_flight = 0
+        self._hedges_in_flight = 0
+        self.counters = {"requests": 0, "hedges_sent": 0, "hedges_capped": 0, "hedge_wins": 0}
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        with self._lock:
+            return self._delay_unlocked()
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def begin(self):
+        with self._lock:
+            self.counters["requests"] += 1
+            self._in_flight += 1
+
+    def end(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def try_hedge(self):
+        """Reserve a hedge slot; False (counted as capped) when the cap is reached"""
+        with self._lock:
+            if self._hedges_in_flight >= max(1, int(self._in_flight * self.max_ratio)):
+                self.counters["hedges_capped"] += 1
+                return False
+            self._hedges_in_flight += 1
+            self.counters["hedges_sent"] += 1
+            return True
+
+    def hedge_finished(self):
+        with self._lock:
+            self._hedges_in_flight -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "hedge_delay_ms": round(self._delay_unlocked() * 1000),
+                "in_flight": self._in_flight,
+                "hedges_in_flight": self._hedges_in_flight,
+                **self.counters
+            }
+
+    def _delay_unlocked(self):
+        if len(self._latencies) < self.min_samples:
+            return self.default_delay
+        return percentile(sorted(self._latencies), self.percentile)
+
+
+def hedged_call(fn, policy, executor, enabled=True):
+    """
+    Run fn() on `executor`, sending one duplicate if it hasn't answered
+    within policy.delay() of starting
+
+    The delay counts from when the primary actually starts running, not
+    from when it was queued: a hedge queued behind the same busy pool
+    would not finish any sooner. Attempts run in a copy of the caller's
+    context, so they see its deadline (see deadline.py) when they start.
+    Returns the first successful result; raises only if every attempt
+    fails. The slower attempt is left to finish in the background.
+
+    Raises:
+        DeadlineExceeded: if the deadline passes before any attempt finished
+            (e.g. while waiting for a free worker)
+    """
+    policy.begin()
+    try:
+        return _hedged_call(fn, policy, executor, enabled)
+    finally:
+        policy.end()
+
+
+def _hedged_call(fn, policy, executor, enabled):
+    def timed(started=None):
+        if started is not None:
+            started.set()
+        start = time.perf_counter()
+        result = fn()
+        policy.record_latency(time.perf_counter() - start)
+        return result
+
+    if not enabled:
+        return timed()
+
+    primary_started = threading.Event()
+    primary = executor.submit(contextvars.copy_context().run, timed, primary_started)
+    if not primary_started.wait(timeout=time_remaining()):
+        primary.cancel()
+        raise DeadlineExceeded("No free worker before the deadline")
+    done, _ = wait([primary], timeout=policy.delay())
+    if done or not policy.try_hedge():
+        return primary.result()
+
+    hedge = executor.submit(contextvars.copy_context().run, timed)
+    hedge.add_done_callback(lambda _: policy.hedge_finished())
+    pending = {primary, hedge}
+    last_error = None
+
+    while pending:
+        # A hedge still queued for a worker must not outlive the deadline
+        done, pending = wait(pending, timeout=time_remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            for future in pending:
+                future.cancel()
+            raise DeadlineExceeded("No attempt finished before the deadline")
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if future is hedge:
+                policy.count("hedge_wins")
+            return result
+
+    raise last_error
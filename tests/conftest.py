@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# config reads the environment at import time, so set it up before any app module is imported
+_cache_dir = tempfile.mkdtemp(prefix="menu-analyzer-tests-")
+os.environ.update({
+    "OPENAI_API_KEY": "sk-test",
+    "USDA_API_KEY": "test",
+    "DISH_INDEX_ENABLED": "False",
+    "JOBS_DB_PATH": os.path.join(_cache_dir, "jobs.sqlite3"),
+    "MENU_STORE_PATH": os.path.join(_cache_dir, "menus.sqlite3"),
+    "PROFILE_DIR": os.path.join(_cache_dir, "profiles"),
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
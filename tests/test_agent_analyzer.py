@@ -0,0 +1,114 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import agent_analyzer
+from agent_analyzer import StreamingAnalysisParser, analyze_menu_with_preferences
+from config import ANALYSIS_MODELS
+
+DISHES = [
+    {"dish": name, "calories": 500, "protein": 30, "carbs": 40, "fat": 20}
+    for name in ("Grilled Salmon", "Caesar Salad", "Beef Burger")
+]
+PREFS = {"goal": "Maintain weight", "diet_type": "None", "allergies": [], "calorie_target": 2000}
+
+
+def _analysis(names):
+    return {
+        "top_picks": [{"name": names[0], "why_good": "lean", "nutrition_highlights": "protein"}],
+        "meal_combos": [{"items": names[:2], "why": "balanced"}],
+        "ranked_dishes": [{"name": name, "score": 8} for name in names],
+        "general_advice": "Drink water, \"plenty\" of it {really}.",
+    }
+
+
+def _feed_in_chunks(text, size):
+    parser = StreamingAnalysisParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_parser_events_do_not_depend_on_chunk_boundaries(size):
+    analysis = _analysis(["Grilled Salmon", "Caesar Salad"])
+    text = "```json\n" + json.dumps(analysis, indent=2) + "\n```"
+
+    events = _feed_in_chunks(text, size)
+
+    assert events == [
+        ("top_picks", analysis["top_picks"][0]),
+        ("meal_combos", analysis["meal_combos"][0]),
+        ("ranked_dishes", analysis["ranked_dishes"][0]),
+        ("ranked_dishes", analysis["ranked_dishes"][1]),
+        ("general_advice", analysis["general_advice"]),
+    ]
+
+
+def test_parser_reports_an_item_only_once_it_is_complete():
+    parser = StreamingAnalysisParser()
+    assert parser.feed('{"top_picks": [{"name": "A, \\"b\\"", "why_good": "x"') == []
+    assert parser.feed('}, {"name"') == [("top_picks", {"name": 'A, "b"', "why_good": "x"})]
+
+
+class _Stream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Replace create_chat_completion; outputs maps model -> analysis dict"""
+    calls = []
+
+    def install(outputs):
+        def create_chat_completion(model, messages, stream=False, **kwargs):
+            calls.append((model, stream))
+            content = json.dumps(outputs[model])
+            if not stream:
+                return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+            return _Stream([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 5]))])
+                for i in range(0, len(content), 5)
+            ])
+
+        monkeypatch.setattr(agent_analyzer, "create_chat_completion", create_chat_completion)
+        return calls
+
+    return install
+
+
+def test_first_tier_is_streamed_and_kept_when_it_passes(fake_openai):
+    good = _analysis([d["dish"] for d in DISHES])
+    calls = fake_openai({ANALYSIS_MODELS[0]: good})
+    events = []
+
+    analysis = analyze_menu_with_preferences(DISHES, PREFS, on_item=lambda *event: events.append(event))
+
+    assert analysis == good
+    assert calls == [(ANALYSIS_MODELS[0], True)]
+    assert [section for section, _ in events].count("ranked_dishes") == len(DISHES)
+    assert ("reset", None) not in events
+
+
+@pytest.mark.skipif(len(ANALYSIS_MODELS) < 2, reason="needs an escalation tier")
+def test_rejected_stream_is_reset_and_replaced_by_escalated_answer(fake_openai):
+    partial = _analysis(["Grilled Salmon"])  # ranking misses most dishes
+    good = _analysis([d["dish"] for d in DISHES])
+    calls = fake_openai({ANALYSIS_MODELS[0]: partial, ANALYSIS_MODELS[1]: good})
+    events = []
+
+    analysis = analyze_menu_with_preferences(DISHES, PREFS, on_item=lambda *event: events.append(event))
+
+    assert analysis == good
+    assert calls == [(ANALYSIS_MODELS[0], True), (ANALYSIS_MODELS[1], False)]
+    assert ("top_picks", partial["top_picks"][0]) in events
+    assert events[-1] == ("reset", None)
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import clients
+from config import OPENAI_RETRY_BASE_SECONDS, OPENAI_RETRY_MAX_SECONDS
+from deadline import use_deadline
+
+
+def _rate_limit_error(headers=None):
+    response = SimpleNamespace(status_code=429, headers=headers or {}, request=None)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_retry_after_header_is_honoured():
+    delay = clients.retry_delay(_rate_limit_error({"retry-after": "3"}), attempt=0)
+    assert 3 <= delay <= 3 + OPENAI_RETRY_BASE_SECONDS
+
+    delay = clients.retry_delay(_rate_limit_error({"retry-after-ms": "250"}), attempt=0)
+    assert 0.25 <= delay <= 0.25 + OPENAI_RETRY_BASE_SECONDS
+
+
+def test_backoff_is_jittered_exponential_and_capped():
+    error = _rate_limit_error({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    for attempt in range(12):
+        cap = min(OPENAI_RETRY_MAX_SECONDS, OPENAI_RETRY_BASE_SECONDS * 2 ** attempt)
+        delays = {clients.retry_delay(error, attempt) for _ in range(20)}
+        assert all(0 <= delay <= cap for delay in delays)
+        assert len(delays) > 1
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    outcomes = []
+    sleeps = []
+
+    def create(**kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(clients, "get_openai_client", lambda: client)
+    monkeypatch.setattr(clients.time, "sleep", sleeps.append)
+    return outcomes, sleeps
+
+
+def test_retries_sleep_for_retry_after(fake_client):
+    outcomes, sleeps = fake_client
+    response = SimpleNamespace(usage=None)
+    outcomes.extend([_rate_limit_error({"retry-after": "2"}), response])
+
+    assert clients.create_chat_completion(model="m", messages=[{"role": "user", "content": "hi"}]) is response
+    assert len(sleeps) == 1 and sleeps[0] >= 2
+
+
+def test_no_retry_when_backoff_outlasts_the_deadline(fake_client):
+    outcomes, sleeps = fake_client
+    outcomes.extend([_rate_limit_error({"retry-after": "30"}), SimpleNamespace(usage=None)])
+
+    with use_deadline(5), pytest.raises(openai.RateLimitError):
+        clients.create_chat_completion(model="m", messages=[{"role": "user", "content": "hi"}])
+    assert sleeps == []
@@ -0,0 +1,58 @@
+import pytest
+
+from config import DISH_INDEX_THRESHOLD
+from dish_index import DishIndex, dish_name_similarity
+
+# Labelled pairs the DISH_INDEX_THRESHOLD default is calibrated on:
+# same dish (nutrition can be shared) vs. a different dish
+SAME_DISH = [
+    ("Grilled Salmon w/ Lemon Butter", "Grilled Atlantic Salmon"),
+    ("Salmon, grilled", "Grilled Salmon"),
+    ("Margherita Pizza", "Pizza Margherita"),
+    ("Chicken Caesar Salad", "Caesar Salad with Chicken"),
+    ("Grilled Chicken Breast", "Chicken Breast"),
+    ("Spaghetti Bolognese", "Spaghetti alla Bolognese"),
+    ("Beef Tacos", "Beef Taco"),
+    ("Iced Tea", "ICED TEA"),
+]
+
+DIFFERENT_DISH = [
+    ("Fried Chicken", "Chicken Fried Rice"),
+    ("Grilled Chicken", "Grilled Chicken Wings"),
+    ("Caesar Salad", "Chicken Caesar Salad"),
+    ("Chicken Salad", "Chicken Salad Sandwich"),
+    ("Chicken Soup", "Chicken Noodle Soup"),
+    ("Chocolate Cake", "Carrot Cake"),
+    ("Beef Burger", "Chicken Burger"),
+    ("Grilled Salmon", "Grilled Chicken"),
+    ("Iced Tea", "Iced Coffee"),
+]
+
+
+@pytest.mark.parametrize("name, other", SAME_DISH)
+def test_same_dish_passes_threshold(name, other):
+    assert dish_name_similarity(name, other) >= DISH_INDEX_THRESHOLD
+    assert dish_name_similarity(other, name) >= DISH_INDEX_THRESHOLD
+
+
+@pytest.mark.parametrize("name, other", DIFFERENT_DISH)
+def test_different_dish_stays_below_threshold(name, other):
+    assert dish_name_similarity(name, other) < DISH_INDEX_THRESHOLD
+    assert dish_name_similarity(other, name) < DISH_INDEX_THRESHOLD
+
+
+def test_search_reranks_lexical_neighbours(tmp_path):
+    index = DishIndex(str(tmp_path), dim=256)
+    index.add("Chicken Fried Rice", {"calories": 520})
+    index.add("Grilled Atlantic Salmon", {"calories": 280})
+
+    entry, similarity = index.search("Fried Chicken")
+    assert entry is None or similarity < DISH_INDEX_THRESHOLD
+
+    entry, similarity = index.search("Grilled Salmon w/ Lemon Butter")
+    assert entry["name"] == "Grilled Atlantic Salmon"
+    assert similarity >= DISH_INDEX_THRESHOLD
+
+    # Survives a reload from disk
+    entry, _ = DishIndex(str(tmp_path), dim=256).search("Grilled Salmon w/ Lemon Butter")
+    assert entry["name"] == "Grilled Atlantic Salmon"
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+import jobs
+import pipeline
+import rate_limiter
+from rate_limiter import BATCH, use_priority
+
+PREFS = {"goal": "muscle_gain", "diet_type": "none", "allergies": [], "calorie_target": 700}
+DISHES = [{"name": "Grilled Salmon", "calories": 280, "protein": 30}]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    analyses = []
+
+    def analyze(dishes_with_nutrition, user_prefs, on_item=None):
+        return analyses.pop(0)
+
+    monkeypatch.setattr(pipeline, "analyze", analyze)
+    queue = jobs.JobQueue(str(tmp_path / "jobs.sqlite3"), workers=1)
+    queue.analyses = analyses
+    return queue
+
+
+def _wait(queue, job_id):
+    for _ in range(200):
+        job = queue.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_identical_request_reuses_llm_result(queue):
+    queue.analyses.append({"top_picks": [{"name": "Grilled Salmon"}]})
+    job_id = queue.submit(PREFS, dishes_with_nutrition=DISHES)
+    assert _wait(queue, job_id)["status"] == "done"
+
+    assert queue.submit(PREFS, dishes_with_nutrition=DISHES) == job_id
+
+
+def test_fallback_result_is_not_reused(queue):
+    queue.analyses.extend([{"top_picks": [], "source": "fallback"}, {"top_picks": []}])
+    job_id = queue.submit(PREFS, dishes_with_nutrition=DISHES)
+    assert _wait(queue, job_id)["result"]["analysis"]["source"] == "fallback"
+
+    retry_id = queue.submit(PREFS, dishes_with_nutrition=DISHES)
+    assert retry_id != job_id
+    assert _wait(queue, retry_id)["result"]["analysis"] == {"top_picks": []}
+
+
+def test_worker_runs_with_the_submitters_priority(queue, monkeypatch):
+    seen = []
+
+    def analyze(dishes_with_nutrition, user_prefs, on_item=None):
+        seen.append(rate_limiter._current_priority.get())
+        return {"top_picks": []}
+
+    monkeypatch.setattr(pipeline, "analyze", analyze)
+    with use_priority(BATCH):
+        job_id = queue.submit(PREFS, dishes_with_nutrition=DISHES)
+    _wait(queue, job_id)
+    assert seen == [BATCH]
+
+
+def test_result_with_skipped_dishes_is_recorded_and_not_reused(queue, monkeypatch):
+    monkeypatch.setattr(pipeline, "extract_dishes", lambda image_bytes: DISHES + [{"name": "Iced Tea"}])
+
+    def fetch_nutrition(dishes, on_progress=None, on_skipped=None):
+        on_skipped(dishes[-1])
+        return DISHES
+
+    monkeypatch.setattr(pipeline, "fetch_nutrition", fetch_nutrition)
+    queue.analyses.extend([{"top_picks": []}, {"top_picks": []}])
+    job_id = queue.submit(PREFS, image_bytes=b"menu")
+    assert _wait(queue, job_id)["result"]["skipped"] == ["Iced Tea"]
+
+    assert queue.submit(PREFS, image_bytes=b"menu") != job_id
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import pipeline
+from menu_store import MenuStore
+
+MENU = [
+    {"name": "Grilled Salmon", "description": "Lemon butter", "price": "$24", "category": "main"},
+    {"name": "Caesar Salad", "description": "Romaine, parmesan", "price": "$12", "category": "appetizer"},
+    {"name": "Iced Tea", "description": "No description provided", "price": "$3", "category": "beverage"},
+]
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    names = []
+
+    def fetch_nutrition(dishes, on_progress=None, on_skipped=None):
+        names.extend(dish["name"] for dish in dishes)
+        return [{**dish, "calories": 100} for dish in dishes]
+
+    monkeypatch.setattr(pipeline, "fetch_nutrition", fetch_nutrition)
+    return names
+
+
+def test_update_only_fetches_added_and_changed_dishes(tmp_path, fetched):
+    store = MenuStore(str(tmp_path / "menus.sqlite3"))
+    assert store.ingest("bistro", MENU)["version"] == 1
+
+    update = [dict(MENU[0], price="$26"), dict(MENU[1], description="Kale, parmesan"),
+              {"name": "Tofu Bowl", "description": "Tofu, rice", "price": "$14", "category": "main"}]
+    fetched.clear()
+    result = store.ingest("bistro", update, image_digest="v2")
+
+    assert sorted(fetched) == ["Caesar Salad", "Tofu Bowl"]
+    assert result["version"] == 2
+    assert result["diff"] == {"added": ["Tofu Bowl"], "changed": ["Caesar Salad"],
+                              "removed": ["Iced Tea"], "unchanged": ["Grilled Salmon"]}
+    assert store.latest("bistro")["dishes_with_nutrition"][0]["price"] == "$26"
+
+
+def test_slow_ingest_does_not_block_other_ingests(tmp_path, monkeypatch):
+    store = MenuStore(str(tmp_path / "menus.sqlite3"))
+    started, release = threading.Event(), threading.Event()
+
+    def fetch_nutrition(dishes, on_progress=None, on_skipped=None):
+        if dishes[0]["name"] == "Slow Dish":
+            started.set()
+            assert release.wait(5)
+        return [{**dish, "calories": 100} for dish in dishes]
+
+    monkeypatch.setattr(pipeline, "fetch_nutrition", fetch_nutrition)
+    slow = threading.Thread(target=store.ingest, args=("bistro", [{"name": "Slow Dish"}]))
+    slow.start()
+    assert started.wait(5)
+
+    # Same and other restaurant go through while the slow lookup is in flight
+    assert store.ingest("diner", MENU)["version"] == 1
+    assert store.ingest("bistro", MENU)["version"] == 1
+
+    release.set()
+    slow.join()
+    assert store.latest("bistro")["version"] == 2
+
+
+def test_version_with_skipped_dishes_is_ingested_again_for_the_same_photo(tmp_path, monkeypatch):
+    store = MenuStore(str(tmp_path / "menus.sqlite3"))
+
+    def fetch_nutrition(dishes, on_progress=None, on_skipped=None):
+        on_skipped(dishes[-1])  # the deadline ran out before the last lookup
+        return [{**dish, "calories": 100} for dish in dishes[:-1]]
+
+    monkeypatch.setattr(pipeline, "fetch_nutrition", fetch_nutrition)
+    result = store.ingest("bistro", MENU, image_digest="photo")
+
+    assert result["skipped"] == ["Iced Tea"]
+    assert store.latest("bistro")["image_digest"] is None
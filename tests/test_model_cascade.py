@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from deadline import DeadlineExceeded
+from rate_limiter import SchedulerTimeout
+
+from model_cascade import run_cascade, get_cascade_metrics
+
+MODELS = ["cheap", "big"]
+
+
+def _models(outputs):
+    calls = []
+
+    def call_model(model):
+        calls.append(model)
+        output = outputs[model]
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+    return call_model, calls
+
+
+def _needs_ok(result):
+    return None if result == "ok" else f"got {result}"
+
+
+def test_first_passing_tier_wins_without_escalating():
+    call_model, calls = _models({"cheap": "ok", "big": "ok"})
+    assert run_cascade("t-first", MODELS, call_model, _needs_ok) == ("ok", "cheap", None)
+    assert calls == ["cheap"]
+
+
+def test_escalates_on_low_confidence():
+    call_model, calls = _models({"cheap": "meh", "big": "ok"})
+    assert run_cascade("t-escalate", MODELS, call_model, _needs_ok) == ("ok", "big", None)
+    assert calls == ["cheap", "big"]
+    assert get_cascade_metrics()["t-escalate"]["cheap"]["escalations"] == 1
+
+
+def test_final_tier_low_confidence_result_is_kept_and_counted():
+    call_model, _ = _models({"cheap": "meh", "big": "almost"})
+    result, model, reason = run_cascade("t-final", MODELS, call_model, _needs_ok)
+    assert (result, model, reason) == ("almost", "big", "got almost")
+    assert get_cascade_metrics()["t-final"]["big"]["low_confidence"] == 1
+
+
+def test_earlier_result_kept_when_final_tier_fails_to_parse():
+    call_model, _ = _models({"cheap": "meh", "big": ValueError("bad json")})
+    assert run_cascade("t-parse", MODELS, call_model, _needs_ok) == ("meh", "cheap", "got meh")
+
+
+def test_unusable_results_are_not_returned():
+    call_model, _ = _models({"cheap": "meh", "big": "almost"})
+    with pytest.raises(ValueError, match="cascade exhausted"):
+        run_cascade("t-unusable", MODELS, call_model, _needs_ok, usable=lambda result: False)
+
+
+def test_raises_when_no_tier_produced_output():
+    call_model, _ = _models({"cheap": KeyError("a"), "big": RuntimeError("down")})
+    with pytest.raises(RuntimeError, match="down"):
+        run_cascade("t-errors", MODELS, call_model, _needs_ok)
+
+
+def _rate_limit_error():
+    response = SimpleNamespace(status_code=429, headers={}, request=None)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.mark.parametrize("error", [_rate_limit_error(), SchedulerTimeout("queue"), DeadlineExceeded("late")])
+def test_capacity_errors_do_not_escalate(error):
+    call_model, calls = _models({"cheap": error, "big": "ok"})
+    with pytest.raises(type(error)):
+        run_cascade("t-capacity", MODELS, call_model, _needs_ok)
+    assert calls == ["cheap"]
+
+
+def test_capacity_error_after_low_confidence_keeps_earlier_result():
+    call_model, calls = _models({"cheap": "meh", "big": _rate_limit_error()})
+    assert run_cascade("t-capacity-late", MODELS, call_model, _needs_ok) == ("meh", "cheap", "got meh")
+    assert calls == ["cheap", "big"]
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import nutrition_fetch
+from deadline import use_deadline
+from resilience import CircuitBreaker
+
+
+@pytest.fixture
+def half_open_breaker(monkeypatch):
+    breaker = CircuitBreaker("usda-test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    monkeypatch.setattr(nutrition_fetch, "_usda_breaker", breaker)
+    monkeypatch.setattr(nutrition_fetch, "USDA_HEDGE_ENABLED", False)
+    return breaker
+
+
+def test_expired_deadline_does_not_take_half_open_trial(half_open_breaker, monkeypatch):
+    monkeypatch.setattr(nutrition_fetch, "_search_usda", lambda *a, **k: pytest.fail("USDA must not be called"))
+
+    with use_deadline(0):
+        assert nutrition_fetch.get_nutrition_usda("Ghost Dish") is None
+
+    assert half_open_breaker.allow()
+
+
+def test_budget_shortened_timeout_releases_half_open_trial(half_open_breaker, monkeypatch):
+    def timeout(dish_name, timeout):
+        assert timeout < nutrition_fetch.USDA_TIMEOUT
+        raise requests.Timeout("read timed out")
+
+    monkeypatch.setattr(nutrition_fetch, "_search_usda", timeout)
+
+    with use_deadline(1.0):
+        assert nutrition_fetch.get_nutrition_usda("Slow Dish") is None
+
+    assert half_open_breaker.state == "half_open"
+    assert half_open_breaker.counters["failures"] == 1
+    assert half_open_breaker.allow()
+
+
+def test_real_timeout_reopens_half_open_breaker(half_open_breaker, monkeypatch):
+    def timeout(dish_name, timeout):
+        raise requests.Timeout("read timed out")
+
+    monkeypatch.setattr(nutrition_fetch, "_search_usda", timeout)
+    half_open_breaker.reset_timeout = 60
+
+    assert nutrition_fetch.get_nutrition_usda("Slow Dish") is None
+    assert half_open_breaker.state == "open"
+
+
+@pytest.fixture
+def busy_executor(monkeypatch):
+    """USDA pool with its only worker busy until release is set"""
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.submit(release.wait)
+    monkeypatch.setattr(nutrition_fetch, "_usda_executor", executor)
+    yield release
+    release.set()
+    executor.shutdown()
+
+
+def test_timeout_is_sized_when_the_lookup_starts(half_open_breaker, busy_executor, monkeypatch):
+    timeouts = []
+
+    def search(dish_name, timeout):
+        timeouts.append(timeout)
+        return None
+
+    monkeypatch.setattr(nutrition_fetch, "_search_usda", search)
+    monkeypatch.setattr(nutrition_fetch, "USDA_HEDGE_ENABLED", True)
+    threading.Timer(0.5, busy_executor.set).start()
+
+    with use_deadline(2.0):
+        nutrition_fetch.get_nutrition_usda("Queued Dish")
+
+    assert timeouts and timeouts[0] <= 1.55
+
+
+def test_saturated_pool_returns_at_the_deadline(half_open_breaker, busy_executor, monkeypatch):
+    monkeypatch.setattr(nutrition_fetch, "_search_usda", lambda *a, **k: pytest.fail("USDA must not be called"))
+    monkeypatch.setattr(nutrition_fetch, "USDA_HEDGE_ENABLED", True)
+
+    start = time.monotonic()
+    with use_deadline(0.2):
+        assert nutrition_fetch.get_nutrition_usda("Queued Dish") is None
+    assert time.monotonic() - start < 1
+
+    assert half_open_breaker.allow()
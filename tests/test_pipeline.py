@@ -0,0 +1,18 @@
+import pipeline
+from deadline import use_deadline
+
+
+def test_dishes_left_without_nutrition_by_the_deadline_are_reported(monkeypatch):
+    known = {"Grilled Salmon": {"calories": 280}}
+    monkeypatch.setattr(pipeline, "get_nutrition_with_fallback", lambda name, description="": known.get(name))
+    pipeline.clear_caches()
+    dishes = [{"name": "Grilled Salmon"}, {"name": "Mystery Stew"}]
+    skipped = []
+
+    assert pipeline.fetch_nutrition(dishes, on_skipped=skipped.append) == [{"name": "Grilled Salmon", "calories": 280}]
+    assert skipped == []  # not found with time to spare: not a skip
+
+    pipeline.clear_caches()
+    with use_deadline(0):
+        pipeline.fetch_nutrition(dishes, on_skipped=skipped.append)
+    assert skipped == [{"name": "Mystery Stew"}]
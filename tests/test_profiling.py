@@ -0,0 +1,51 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import attach_thread, profile_run
+
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def run_work():
+    _spin(0.15)
+
+
+def helper_work():
+    _spin(0.15)
+
+
+def other_session_work(stop):
+    while not stop.is_set():
+        _spin(0.01)
+
+
+def test_only_the_run_and_its_helper_threads_are_sampled():
+    stop = threading.Event()
+    other = threading.Thread(target=other_session_work, args=(stop,))
+    other.start()
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor, profile_run("scoped", enabled=True) as profiler:
+            helper = executor.submit(attach_thread(helper_work))
+            run_work()
+            helper.result()
+    finally:
+        stop.set()
+        other.join()
+
+    with open(profiler.paths["collapsed"]) as f:
+        collapsed = f.read()
+    assert "run_work" in collapsed
+    assert "helper_work" in collapsed
+    assert "other_session_work" not in collapsed
+
+    with open(profiler.paths["allocations"]) as f:
+        assert "process-wide" in f.read()
+
+
+def test_attach_thread_is_a_no_op_outside_a_profiled_run():
+    assert attach_thread(helper_work) is helper_work
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import BATCH, INTERACTIVE, OpenAIScheduler, SchedulerTimeout, use_priority
+
+
+def _drained(rpm=600, tpm=1_000_000):
+    scheduler = OpenAIScheduler(rpm, tpm)
+    scheduler._requests = 0.0
+    return scheduler
+
+
+def _queue_in_order(scheduler, requests):
+    """Start one waiter per (label, priority), each after the previous one is queued"""
+    admitted = []
+    threads = []
+    for label, priority in requests:
+        def run(label=label, priority=priority):
+            scheduler.acquire(10, priority=priority)
+            admitted.append(label)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        while len(scheduler._waiting) < len(threads):
+            time.sleep(0.001)
+
+    for thread in threads:
+        thread.join(timeout=5)
+    return admitted
+
+
+def test_interactive_is_admitted_before_earlier_batch():
+    scheduler = _drained()
+    admitted = _queue_in_order(scheduler, [("batch-1", BATCH), ("batch-2", BATCH), ("user", INTERACTIVE)])
+    assert admitted == ["user", "batch-1", "batch-2"]
+
+
+def test_same_priority_is_first_come_first_served():
+    scheduler = _drained()
+    admitted = _queue_in_order(scheduler, [(f"user-{i}", INTERACTIVE) for i in range(4)])
+    assert admitted == ["user-0", "user-1", "user-2", "user-3"]
+
+
+def test_priority_defaults_to_the_use_priority_context():
+    scheduler = OpenAIScheduler(600, 1_000_000)
+    with use_priority(BATCH):
+        scheduler.acquire(10)
+    scheduler.acquire(10)
+
+    metrics = scheduler.metrics()
+    assert metrics["batch"]["admitted"] == 1
+    assert metrics["interactive"]["admitted"] == 1
+
+
+def test_timeout_leaves_the_queue():
+    scheduler = _drained(rpm=1)
+    with pytest.raises(SchedulerTimeout):
+        scheduler.acquire(10, timeout=0.05)
+
+    metrics = scheduler.metrics()
+    assert metrics["interactive"]["timeouts"] == 1
+    assert metrics["interactive"]["queue_depth"] == 0
+
+
+def test_settle_returns_unused_tokens():
+    scheduler = OpenAIScheduler(600, 1000)
+    reserved = scheduler.acquire(800)
+    scheduler.settle(reserved, 300)
+    assert scheduler.metrics()["available_tokens"] == pytest.approx(700, abs=5)
@@ -0,0 +1,133 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from deadline import DeadlineExceeded, time_remaining, use_deadline
+from resilience import CircuitBreaker, HedgePolicy, hedged_call
+
+
+def _open_breaker(reset_timeout=0.05):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=reset_timeout)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures_only():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.metrics()["short_circuited"] == 1
+
+
+def test_half_open_lets_one_trial_through_and_success_closes():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+
+    assert breaker.allow()
+    assert not breaker.allow()  # trial still in flight
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.metrics()["opened"] == 2
+
+
+def test_released_trial_frees_the_slot():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_hedge_cap_scales_with_calls_in_flight():
+    policy = HedgePolicy(max_ratio=0.1)
+    for _ in range(5):
+        policy.begin()
+    assert policy.try_hedge()
+    assert not policy.try_hedge()  # at least one, otherwise 10% of 5
+
+    for _ in range(15):
+        policy.begin()
+    assert policy.try_hedge()  # 10% of 20
+    assert not policy.try_hedge()
+
+    policy.hedge_finished()
+    assert policy.try_hedge()
+    assert policy.metrics()["hedges_capped"] == 2
+
+
+def test_slow_primary_is_hedged_and_hedge_wins():
+    calls = itertools.count()
+
+    def fn():
+        if next(calls) == 0:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    policy = HedgePolicy(default_delay=0.05)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert hedged_call(fn, policy, executor) == "hedge"
+    assert policy.metrics()["hedge_wins"] == 1
+    assert policy.metrics()["in_flight"] == 0
+
+
+def test_hedge_delay_starts_when_the_primary_starts():
+    release = threading.Event()
+    policy = HedgePolicy(default_delay=0.05)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(release.wait)  # keeps the only worker busy
+        threading.Timer(0.2, release.set).start()
+        assert hedged_call(lambda: "primary", policy, executor) == "primary"
+    assert policy.metrics()["hedges_sent"] == 0
+
+
+def test_error_is_raised_when_every_attempt_fails():
+    def fn():
+        time.sleep(0.1)
+        raise ValueError("down")
+
+    policy = HedgePolicy(default_delay=0.01)
+    with ThreadPoolExecutor(max_workers=2) as executor, pytest.raises(ValueError, match="down"):
+        hedged_call(fn, policy, executor)
+    assert policy.metrics()["hedges_sent"] == 1
+
+
+def test_waiting_for_a_worker_is_bounded_by_the_deadline():
+    release = threading.Event()
+    ran = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(release.wait)  # pool saturated
+        start = time.monotonic()
+        with use_deadline(0.1), pytest.raises(DeadlineExceeded):
+            hedged_call(lambda: ran.append(True), HedgePolicy(), executor)
+        assert time.monotonic() - start < 1
+        release.set()
+    assert ran == []
+
+
+def test_attempts_see_the_callers_deadline():
+    with ThreadPoolExecutor(max_workers=1) as executor, use_deadline(5):
+        remaining = hedged_call(time_remaining, HedgePolicy(), executor)
+    assert remaining is not None and remaining <= 5